@@ -0,0 +1,268 @@
+"""Micro benchmarks of the ORM and of the /products/ endpoint
+
+Runs against the SQLite stand-in of the Firebird server (FIREBIRD_BACKEND=sqlite),
+seeded with synthetic PRODUTO, PRODUTOESTOQUE, PRODUTOPRECO and CODIGO data.
+Each catalogue size runs on its own process, so the singletons and caches start empty.
+
+Usage, from the project root:
+
+    python benchmarks/bench_orm.py --sizes 100 1000 10000
+    python benchmarks/bench_orm.py --save baseline.json
+    python benchmarks/bench_orm.py --compare baseline.json --threshold 1.25
+
+With --compare the script exits with error when any benchmark is slower
+than the saved one by more than the threshold.
+"""
+
+from __future__ import annotations
+import argparse
+import json
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import timeit
+from datetime import datetime, timedelta
+from typing import Callable
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+SCHEMA = """
+CREATE TABLE PRODUTO (
+    CODPROD VARCHAR(6) PRIMARY KEY,
+    CODIGO VARCHAR(20),
+    NOMEPROD VARCHAR(80),
+    UNIDADE VARCHAR(3),
+    DESCMAXIMO NUMERIC(15, 2),
+    FLAGINATIVO CHAR(1),
+    FLAGNAOVENDER CHAR(1),
+    FLAGCONTROLAESTOQUE CHAR(1)
+);
+CREATE TABLE PRODUTOESTOQUE (
+    CODPROD VARCHAR(6),
+    CODEMPRESA INTEGER,
+    CODSETORESTOQUE VARCHAR(9),
+    ESTATU NUMERIC(15, 4),
+    LAST_CHANGE TIMESTAMP,
+    PRIMARY KEY (CODPROD, CODEMPRESA)
+);
+CREATE TABLE PRODUTOPRECO (
+    CODPRODUTOPRECO VARCHAR(9) PRIMARY KEY,
+    CODPROD VARCHAR(6),
+    CODPRECO VARCHAR(9),
+    PRECO NUMERIC(15, 4)
+);
+CREATE INDEX PRODUTOPRECO_CODPROD ON PRODUTOPRECO (CODPROD, CODPRECO);
+CREATE TABLE CODIGO (
+    NOMETABELA VARCHAR(31),
+    NOMECAMPO VARCHAR(31),
+    ULTIMOCODIGO INTEGER
+);
+"""
+
+WORDS = ["CAFE", "ACUCAR", "ARROZ", "FEIJAO", "OLEO", "LEITE", "SABAO", "MILHO"]
+UNITS = ["UN", "KG", "CX", "LT"]
+
+
+def seed(path: str, size: int) -> None:
+    """Creates the Firebird tables on the SQLite database with size products"""
+
+    rand = random.Random(size)
+    now = datetime(2021, 1, 1)
+
+    con = sqlite3.connect(path)
+    con.executescript(SCHEMA)
+
+    products, stocks, prices = [], [], []
+    for idx in range(1, size + 1):
+        codprod = str(idx).rjust(6, "0")
+        name = " ".join(rand.sample(WORDS, 3)) + f" {idx}"
+        flags = [rand.choice("NNNS") for _ in range(2)] + ["S"]
+
+        products.append(
+            [codprod, f"789{idx:010d}", name, rand.choice(UNITS), 0, *flags]
+        )
+        stocks.append(
+            [
+                codprod,
+                1,
+                str(rand.randint(1, 5)).rjust(9, "0"),
+                rand.uniform(-10, 500),
+                now + timedelta(minutes=idx),
+            ]
+        )
+        for codpreco in range(1, 3):
+            prices.append(
+                [
+                    str(len(prices) + 1).rjust(9, "0"),
+                    codprod,
+                    str(codpreco).rjust(9, "0"),
+                    rand.uniform(1, 200),
+                ]
+            )
+
+    con.executemany("INSERT INTO PRODUTO VALUES (?, ?, ?, ?, ?, ?, ?, ?)", products)
+    con.executemany("INSERT INTO PRODUTOESTOQUE VALUES (?, ?, ?, ?, ?)", stocks)
+    con.executemany("INSERT INTO PRODUTOPRECO VALUES (?, ?, ?, ?)", prices)
+    con.executemany(
+        "INSERT INTO CODIGO VALUES (?, ?, ?)",
+        [
+            ["PRODUTO", "CODPROD", size],
+            ["PRODUTOPRECO", "CODPRODUTOPRECO", len(prices)],
+        ],
+    )
+    con.commit()
+    con.close()
+
+
+def measure(function: Callable[[], object], repeat: int = 5) -> dict:
+    """Times the function with timeit, running it enough times per round"""
+
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    times = [time / number for time in timer.repeat(repeat=repeat, number=number)]
+
+    return {"best": min(times), "mean": sum(times) / len(times), "loops": number}
+
+
+def run_size(size: int) -> dict:
+    """Runs the benchmarks on a new database with size products"""
+
+    workdir = tempfile.mkdtemp(prefix="bench_orm_")
+    firebird_path = os.path.join(workdir, "firebird.db")
+    seed(firebird_path, size)
+
+    os.environ["FIREBIRD_BACKEND"] = "sqlite"
+    os.environ["FIREBIRDPATH"] = firebird_path
+    os.environ["SEARCH_INDEX_REFRESH"] = "3600"
+    os.environ["SNAPSHOT_INTERVAL"] = "0"
+    os.environ["SNAPSHOT_DIR"] = os.path.join(workdir, "snapshots")
+
+    os.chdir(ROOT)
+    sys.path.insert(0, os.path.join(ROOT, "src"))
+    sys.path.insert(0, ROOT)
+
+    import App
+    from sql_alchemy import db
+    from models.firebird.product import ProductModel
+    from models.firebird.product_search import ProductSearchIndex
+    from src.ORM.FDB_handler import FDBHandler
+
+    App.app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + os.path.join(
+        workdir, "database.db"
+    )
+    App.db = db
+    db.init_app(App.app)
+
+    client = App.app.test_client()
+    client.get("/")
+
+    # Waits for the search index loaded on background by the first request
+    ProductSearchIndex.for_company().ensure_fresh()
+
+    handler = FDBHandler()
+    page = max(size // 50 // 2, 1)
+    select = ProductModel._statements["select"]
+
+    with App.app.app_context():
+        rows = handler.fetchall(select)
+        objects = [ProductModel._from_row(row) for row in rows]
+
+        codes = [obj.CODPROD for obj in objects]
+        stocks = ProductModel._load_stocks(codes)
+        prices = ProductModel._load_prices(codes)
+
+        benchmarks = {
+            "query_building": lambda: (
+                ProductModel._basic_query(page, 50),
+                ProductModel._build_where("CAFE ACUCAR", "NOMEPROD", exact=False),
+                ProductModel._keyset_query([], [], 50, "000100"),
+            ),
+            "fetch_tuples": lambda: handler.fetchall(select),
+            "fetch_dicts": lambda: handler.fetchall_as_dict(select),
+            "materialize_objects": lambda: [
+                ProductModel._from_row(row) for row in rows
+            ],
+            "convert_to_json": lambda: [
+                obj._build_json(stocks.get(obj.CODPROD), prices.get(obj.CODPROD), None)
+                for obj in objects
+            ],
+            "products_page": lambda: client.get(f"/products/?PAGE={page}"),
+            "products_search": lambda: client.get("/products/?NOMEPROD=cafe"),
+        }
+
+        for url in (f"/products/?PAGE={page}", "/products/?NOMEPROD=cafe"):
+            response = client.get(url)
+            if response.status_code != 200:
+                raise RuntimeError(f"{url} returned {response.status_code}")
+
+        results = {}
+        for name, function in benchmarks.items():
+            results[name] = measure(function)
+            handler.release()
+
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Returns the benchmarks slower than the baseline by more than the threshold"""
+
+    slower = []
+    for size, benchmarks in results.items():
+        for name, result in benchmarks.items():
+            saved = baseline.get(size, {}).get(name)
+            if saved and result["best"] > saved["best"] * threshold:
+                slower.append((size, name, result["best"] / saved["best"]))
+    return slower
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--save", help="Saves the results on a json file")
+    parser.add_argument("--compare", help="Compares with the results of --save")
+    parser.add_argument("--threshold", type=float, default=1.25)
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.size:
+        print(json.dumps(run_size(args.size)))
+        return 0
+
+    results = {}
+    for size in args.sizes:
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--size", str(size)],
+            check=True,
+            stdout=subprocess.PIPE,
+            text=True,
+        ).stdout
+        results[str(size)] = json.loads(output.strip().splitlines()[-1])
+
+        print(f"\n{size} products")
+        for name, result in results[str(size)].items():
+            print(
+                f"  {name:<22} best {result['best'] * 1000:10.3f} ms"
+                f"   mean {result['mean'] * 1000:10.3f} ms"
+            )
+
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as file:
+            slower = compare(results, json.load(file), args.threshold)
+
+        for size, name, ratio in slower:
+            print(f"Regression: {name} with {size} products is {ratio:.2f}x slower")
+        if slower:
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,12 +3,31 @@ from flask_restful import Api
 from flask_jwt_extended import JWTManager
 import os
 
-from resources.products import Products, ProductDetail
-from resources.stock import Stock
+from resources.products import (
+    Products,
+    ProductDetail,
+    ProductByCode,
+    ProductExport,
+    ProductChanges,
+    ProductSnapshot,
+)
+from resources.stock import Stock, StockBulk
 from resources.authentication import Authentication
 from resources.update import Update
+from resources.cache import Cache
+from resources.report import StockReport
 
 from resources.user import User
+from models.sqlite.update import UpdateModel
+from models.sqlite.product_change import ProductChangeModel
+from models.sqlite.user import UserDirectory
+from models.firebird.catalogue_snapshot import CatalogueSnapshot
+from models.firebird.product_search import ProductSearchIndex
+
+from src.ORM.FDB_handler import FDBHandler
+from metrics import init_metrics
+from company import init_company
+from representations import output_json
 
 database_path = os.path.abspath(os.getcwd()) + "\database.db"
 
@@ -18,7 +37,10 @@ app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 app.config["SQLALCHEMY_ECHO"] = False
 app.config["JWT_SECRET_KEY"] = "eyJ0eXAiOiJKV1QiLCJhbGciOiJIUzI1NiJ9"
 api = Api(app)
+api.representations["application/json"] = output_json
 jwt = JWTManager(app)
+init_metrics(app)
+init_company(app)
 
 
 @app.route("/")
@@ -29,13 +51,32 @@ def home():
 @app.before_first_request
 def buildDatabase():
     db.create_all()
+    UpdateModel.create_columns(FDBHandler().default_company)
+    UpdateModel.create_indexes()
+    ProductChangeModel.create_columns()
+    UserDirectory.warm()
+    ProductSearchIndex.for_company().warm()
+    CatalogueSnapshot.start(app)
+
+
+@app.teardown_appcontext
+def releaseConnection(exception):
+    FDBHandler().release()
+    FDBHandler().use_company(None)
 
 
 api.add_resource(Products, "/products/")
 api.add_resource(ProductDetail, "/products/<id>")
+api.add_resource(ProductExport, "/products/export")
+api.add_resource(ProductChanges, "/products/changes")
+api.add_resource(ProductSnapshot, "/products/snapshot")
+api.add_resource(ProductByCode, "/products/by-code/<codigo>")
 api.add_resource(Stock, "/stock/")
+api.add_resource(StockBulk, "/stock/bulk")
 api.add_resource(Authentication, "/auth/")
 api.add_resource(Update, "/updates/<id>")
+api.add_resource(Cache, "/cache/")
+api.add_resource(StockReport, "/reports/stock")
 
 api.add_resource(User, "/users/", "/users/<id>", endpoint="users")
 
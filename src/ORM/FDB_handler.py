@@ -1,10 +1,25 @@
 from __future__ import annotations
-from collections import defaultdict
-from typing import List, Tuple, Union, Type, TypeVar
+from array import array
+from collections import OrderedDict, defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Tuple, Union, Type, TypeVar
+import base64
+import json
+import queue
+import threading
+import time
+import copy
+import importlib
+import inspect
+import weakref
+from operator import attrgetter
 import fdb
 from decimal import Decimal
 from datetime import datetime
-from decouple import config
+from decouple import Csv, config
+
+from .cache import LRUCache
 
 T = TypeVar("T", bound="TrivialClass")
 
@@ -14,37 +29,462 @@ class Singleton(type):
 
     Uses the __call__ to check if the class is already instanciated,
     if not saves the class instance to return when called.
+    The instance is created under a lock, so threads calling the class
+    at the same time get the same instance.
     """
 
     _instances: dict = {}
+    _lock = threading.RLock()
 
     def __call__(cls, *args, **kwargs) -> None:
         if cls not in cls._instances:
-            cls._instances[cls] = super().__call__(*args, **kwargs)
+            with Singleton._lock:
+                if cls not in cls._instances:
+                    cls._instances[cls] = super().__call__(*args, **kwargs)
         return cls._instances[cls]
 
 
+class ConnectionPool:
+    """Bounded pool of database connections
+
+    Connections are created on demand up to the pool size and reused after being returned.
+    Idle connections are health checked before being handed out again,
+    being replaced by a new connection when broken.
+
+    Attributes:
+        connect:
+            A callable that opens a new connection.
+        size:
+            The maximum number of connections opened at the same time.
+        timeout:
+            The seconds to wait for a free connection before failing.
+        ping_interval:
+            The seconds a connection can stay idle before being checked.
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[], fdb.Connection],
+        size: int = 10,
+        timeout: float = 30,
+        ping_interval: float = 60,
+    ) -> None:
+        self.size = size
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+
+        self._connect = connect
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle = queue.LifoQueue()
+
+        self.in_use = 0
+        self.waits = 0
+        self._counter_lock = threading.Lock()
+
+    def acquire(self) -> fdb.Connection:
+        """Checks out a connection from the pool
+
+        Returns:
+            A healthy connection.
+
+        Raises:
+            TimeoutError: When no connection is released before the timeout.
+        """
+
+        if not self._slots.acquire(blocking=False):
+            with self._counter_lock:
+                self.waits += 1
+            if not self._slots.acquire(timeout=self.timeout):
+                raise TimeoutError(
+                    f"No database connection available after {self.timeout} seconds"
+                )
+
+        try:
+            while True:
+                try:
+                    con, released_at = self._idle.get_nowait()
+                except queue.Empty:
+                    con = self._connect()
+                    break
+
+                idle_for = time.monotonic() - released_at
+                if idle_for < self.ping_interval or self.is_alive(con):
+                    break
+                self._close(con)
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._counter_lock:
+            self.in_use += 1
+        return con
+
+    def release(self, con: fdb.Connection, broken: bool = False) -> None:
+        """Returns a connection to the pool
+
+        Any work not commited is rolled back.
+
+        Attributes:
+            con:
+                The connection checked out with acquire.
+            broken:
+                If true the connection is closed instead of being reused.
+        """
+
+        try:
+            if not broken and not con.closed:
+                try:
+                    con.rollback()
+                    self._idle.put((con, time.monotonic()))
+                    return
+                except fdb.Error:
+                    pass
+            self._close(con)
+        finally:
+            with self._counter_lock:
+                self.in_use -= 1
+            self._slots.release()
+
+    def stats(self) -> dict:
+        """Returns the counters of the pool"""
+
+        return {
+            "size": self.size,
+            "in_use": self.in_use,
+            "idle": self._idle.qsize(),
+            "waits": self.waits,
+        }
+
+    @contextmanager
+    def connection(self) -> Iterator[fdb.Connection]:
+        """Checks out a connection for the duration of a with block"""
+
+        con = self.acquire()
+        try:
+            yield con
+        except fdb.Error:
+            self.release(con, broken=not self.is_alive(con))
+            raise
+        except BaseException:
+            self.release(con)
+            raise
+        else:
+            self.release(con)
+
+    @staticmethod
+    def is_alive(con: fdb.Connection) -> bool:
+        """Checks if the connection still talks to the server"""
+
+        if con.closed:
+            return False
+
+        try:
+            cur = con.cursor()
+            cur.execute("SELECT 1 FROM RDB$DATABASE")
+            cur.fetchone()
+            cur.close()
+        except fdb.Error:
+            return False
+        return True
+
+    @staticmethod
+    def _close(con: fdb.Connection) -> None:
+        try:
+            con.close()
+        except fdb.Error:
+            pass
+
+
 class FDBHandler(metaclass=Singleton):
     """Main database handler class
 
     Responsable for making most of the database related functions.
-    This class uses the singleton metaclass to main the same database connection across the server.
+    This class uses the singleton metaclass to share the same connection pool across the server.
+
+    Each thread checks out a connection from the pool on its first query
+    and keeps it, with its transaction, until release is called.
+    On the server it's done at the end of each request.
+
+    Each thread also works for a company, setted by use_company.
+    The companies with a FIREBIRDPATH_<CODEMPRESA> on .env have their own database,
+    with its own pool, the others use the FIREBIRDPATH database.
 
     Attributes:
         path:
             The database path.
+            Defaults to FIREBIRDPATH on .env
         user:
             The database user.
-            Defaults to SYSDBA
+            Defaults to FIREBIRDUSER on .env or SYSDBA
         password:
             The database password.
-            Defaults to masterkey
+            Defaults to FIREBIRDPASSWORD on .env or masterkey
+        pool_size:
+            The maximum number of connections.
+            Defaults to FIREBIRD_POOL_SIZE on .env or 10
+        backend:
+            The module opening the connections, with the same connect function of fdb.
+            Can be fdb, sqlite for a local SQLite stand-in or the import path of a module.
+            Defaults to FIREBIRD_BACKEND on .env or fdb
+        default_company:
+            The company of the threads that didn't set one.
+            Defaults to CODEMPRESA on .env
+        companies:
+            The companies that can be used.
+            Defaults to EMPRESAS on .env, separated by comma, or the default company
+        listeners:
+            Functions called after each database operation with
+            the operation name, the seconds it took and the number of rows fetched.
     """
 
+    listeners: List[Callable[[str, float, int], None]] = []
+
+    backends = {"fdb": "fdb", "sqlite": ".sqlite_backend"}
+
     def __init__(
-        self, path: str, user: str = "SYSDBA", password: str = "masterkey"
+        self,
+        path: str = None,
+        user: str = None,
+        password: str = None,
+        pool_size: int = None,
+        backend: str = None,
     ) -> None:
-        self.con = fdb.connect(path, user, password)
+        path = path or config("FIREBIRDPATH")
+        user = user or config("FIREBIRDUSER", default="SYSDBA")
+        password = password or config("FIREBIRDPASSWORD", default="masterkey")
+
+        backend = backend or config("FIREBIRD_BACKEND", default="fdb")
+        connect = importlib.import_module(
+            self.backends.get(backend, backend), __package__
+        ).connect
+
+        pool_size = pool_size or config("FIREBIRD_POOL_SIZE", default=10, cast=int)
+
+        def new_pool(path: str) -> ConnectionPool:
+            return ConnectionPool(
+                lambda: connect(path, user, password),
+                size=pool_size,
+                timeout=config("FIREBIRD_POOL_TIMEOUT", default=30, cast=float),
+                ping_interval=config("FIREBIRD_POOL_PING", default=60, cast=float),
+            )
+
+        self.pool = new_pool(path)
+        self._new_pool = new_pool
+        self._pools = {None: self.pool}  # database: pool
+        self._databases = {}  # company: database
+        self._pools_lock = threading.Lock()
+        self._local = threading.local()
+
+        self.default_company = config("CODEMPRESA", default=None)
+        self.companies = config(
+            "EMPRESAS", default=self.default_company or "", cast=Csv()
+        )
+
+        self.statement_cache_size = config(
+            "FIREBIRD_STATEMENT_CACHE", default=100, cast=int
+        )
+        self._statements = weakref.WeakKeyDictionary()
+        self._statements_lock = threading.Lock()
+
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    @property
+    def con(self) -> fdb.Connection:
+        """The connection checked out by the current thread, on its company database"""
+
+        con = getattr(self._local, "con", None)
+        if con is None:
+            self._local.pool = self.pool_for(self.company)
+            con = self._local.con = self._local.pool.acquire()
+            self._local.used = False
+        return con
+
+    def release(self) -> None:
+        """Returns the connection of the current thread to the pool
+
+        Any work not commited is rolled back.
+        """
+
+        con = getattr(self._local, "con", None)
+        if con is not None:
+            self._local.con = None
+            self._local.after_commit = []
+            self._local.pool.release(con)
+
+    @property
+    def company(self) -> str:
+        """The company of the current thread"""
+
+        return getattr(self._local, "company", None) or self.default_company
+
+    @property
+    def database(self) -> str:
+        """The database of the current thread company, None for FIREBIRDPATH"""
+
+        return self.database_of(self.company)
+
+    def use_company(self, company: str = None) -> None:
+        """Sets the company of the current thread, None for the default company
+
+        When the company is on another database,
+        the connection of the thread is released, rolling back its work.
+        """
+
+        if self.database_of(company or self.default_company) != self.database:
+            self.release()
+        self._local.company = company
+
+    def database_of(self, company: str) -> str:
+        """Gets the database of the company
+
+        Returns:
+            The company, when it has a FIREBIRDPATH_<CODEMPRESA> on .env,
+            or None when it uses the FIREBIRDPATH database.
+        """
+
+        if company not in self._databases:
+            path = config(f"FIREBIRDPATH_{company}", default=None)
+            self._databases[company] = company if path else None
+        return self._databases[company]
+
+    def pool_for(self, company: str) -> ConnectionPool:
+        """Gets the pool of the company database, creating it on the first use"""
+
+        database = self.database_of(company)
+
+        if database not in self._pools:
+            with self._pools_lock:
+                if database not in self._pools:
+                    self._pools[database] = self._new_pool(
+                        config(f"FIREBIRDPATH_{database}")
+                    )
+        return self._pools[database]
+
+    @property
+    def pools(self) -> dict:
+        """The pools opened so far, by database, None for the FIREBIRDPATH database"""
+
+        return dict(self._pools)
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        """Thread pool for the background work, sized as the connection pool"""
+
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.pool.size, thread_name_prefix="fdb"
+                    )
+        return self._executor
+
+    def run_in_background(self, function: Callable[[], T]) -> Future:
+        """Runs the function on the executor, with the company of the current thread
+
+        Meant for the work outside the Firebird database, like the SQLite querys.
+        A function querying the Firebird database checks out another connection
+        while the current thread keeps its own, so many requests waiting on
+        background querys can use all the pool connections and wait for each other.
+
+        Returns:
+            The future of the function result.
+        """
+
+        company = getattr(self._local, "company", None)
+        return self.executor.submit(self._run_and_release, function, company)
+
+    def _run_and_release(self, function: Callable[[], T], company: str = None) -> T:
+        self._local.company = company
+        try:
+            return function()
+        finally:
+            self.release()
+            self._local.company = None
+
+    def after_commit(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """Registers a function to be called after the current transaction is commited
+
+        The functions are discarded on rollback and release.
+        A function already registered on the transaction is not registered again.
+
+        Returns:
+            The function registered, the one already registered when equal to callback.
+        """
+
+        if not hasattr(self._local, "after_commit"):
+            self._local.after_commit = []
+
+        for registered in self._local.after_commit:
+            if registered == callback:
+                return registered
+
+        self._local.after_commit.append(callback)
+        return callback
+
+    def _execute(self, query: str, params: list) -> fdb.Cursor:
+        """Executes the query on the connection of the current thread
+
+        When the connection is found broken it's discarded,
+        and the query is retried on a new connection if no other work was done on it.
+        """
+
+        con = self.con
+
+        try:
+            cur, prepared = self._prepare(con, query)
+            cur.execute(prepared, params)
+        except fdb.Error:
+            if ConnectionPool.is_alive(con):
+                raise
+
+            self._local.con = None
+            self._local.pool.release(con, broken=True)
+
+            if self._local.used:
+                raise
+
+            cur, prepared = self._prepare(self.con, query)
+            cur.execute(prepared, params)
+
+        self._local.used = True
+        return cur
+
+    def _notify(self, operation: str, started: float, rows: int = 0) -> None:
+        """Calls the listeners with the time since started"""
+
+        if self.listeners:
+            elapsed = time.perf_counter() - started
+            for listener in self.listeners:
+                listener(operation, elapsed, rows)
+
+    def _prepare(
+        self, con: fdb.Connection, query: str
+    ) -> Tuple[fdb.Cursor, fdb.PreparedStatement]:
+        """Gets the prepared statement of the query on the connection
+
+        The statements are prepared once per connection and kept on a LRU cache,
+        so the server don't parse the same query again.
+        The size of the cache is setted by FIREBIRD_STATEMENT_CACHE on .env.
+
+        Returns:
+            The cursor owning the statement and the statement.
+        """
+
+        statements = self._statements.get(con)
+        if statements is None:
+            with self._statements_lock:
+                statements = self._statements.setdefault(con, OrderedDict())
+
+        if query in statements:
+            statements.move_to_end(query)
+            return statements[query]
+
+        cur = con.cursor()
+        statements[query] = cur, cur.prep(query)
+        if len(statements) > self.statement_cache_size:
+            statements.popitem(last=False)
+        return statements[query]
 
     def fetchall_as_dict(
         self, query: str, params: list = [], one_key: bool = False
@@ -64,23 +504,173 @@ class FDBHandler(metaclass=Singleton):
             A dict the the data fetched
         """
 
-        cur = self.con.cursor()
-        cur.execute(query, params)
+        started = time.perf_counter()
+        cur = self._execute(query, params)
         coumns_names = [row[0] for row in cur.description]
 
         data = cur.fetchall()
         cur.close()
+        self._notify("fetchall_as_dict", started, len(data))
 
         if one_key:
-            data_dict = defaultdict(list)
-            for row in data:
-                for idx in range(len(row)):
-                    data_dict[coumns_names[idx]].append(row[idx])
-            return dict(data_dict)
+            return dict(zip(coumns_names, map(list, zip(*data))))
         return [
             {coumns_names[idx]: row[idx] for idx in range(len(row))} for row in data
         ]
 
+    def fetchall_as_columns(
+        self,
+        query: str,
+        params: list = [],
+        typecodes: dict = {},
+        batch_size: int = 1000,
+    ) -> dict:
+        """Fetch all the rows organized per column, on compact arrays
+
+        The columns with a typecode are stored on array.array,
+        that can be used by numpy without copying (numpy.frombuffer).
+        On float arrays NULL values are stored as NaN, on integer arrays as 0.
+        The other columns are stored on lists.
+
+        Attributes:
+            query:
+                The SQL query.
+            params:
+                The list of parameters to be passed to the query.
+                This atribute is optional
+            typecodes:
+                The array.array typecode of the numeric columns, like "d" for floats.
+            batch_size:
+                The number of rows fetched from the server at once.
+
+        Returns:
+            A dict with the columns as key and the array of values
+        """
+
+        started = time.perf_counter()
+        cur = self._execute(query, params)
+        coumns_names = [row[0] for row in cur.description]
+
+        columns = [
+            array(typecodes[name]) if name in typecodes else [] for name in coumns_names
+        ]
+        null_values = [
+            float("nan") if typecodes.get(name) in ("f", "d") else 0
+            for name in coumns_names
+        ]
+
+        while True:
+            data = cur.fetchmany(batch_size)
+            if not data:
+                break
+
+            for column, null_value, values in zip(columns, null_values, zip(*data)):
+                if isinstance(column, array):
+                    column.extend(null_value if v is None else v for v in values)
+                else:
+                    column.extend(values)
+
+        cur.close()
+        self._notify("fetchall_as_columns", started, len(columns[0]) if columns else 0)
+
+        return dict(zip(coumns_names, columns))
+
+    def fetchall(self, query: str, params: list = []) -> List[tuple]:
+        """Fetch all the rows as tuples, on the order of the query columns
+
+        Attributes:
+            query:
+                The SQL query.
+            params:
+                The list of parameters to be passed to the query.
+                This atribute is optional
+
+        Returns:
+            A list of tuples with the data fetched
+        """
+
+        started = time.perf_counter()
+        cur = self._execute(query, params)
+        data = cur.fetchall()
+        cur.close()
+        self._notify("fetchall", started, len(data))
+
+        return data
+
+    def fetchone(self, query: str, params: list = []) -> tuple:
+        """Fetch one row as a tuple, on the order of the query columns
+
+        Attributes:
+            query:
+                The SQL query.
+            params:
+                The list of parameters to be passed to the query.
+                This atribute is optional
+
+        Returns:
+            A tuple with the data fetched, or None when no row is found
+        """
+
+        started = time.perf_counter()
+        cur = self._execute(query, params)
+        data = cur.fetchone()
+        cur.close()
+        self._notify("fetchone", started, 0 if data is None else 1)
+
+        return data
+
+    def iter_rows(
+        self,
+        query: str,
+        params: list = [],
+        batch_size: int = 500,
+        as_dict: bool = True,
+    ) -> Iterator[Union[dict, tuple]]:
+        """Iterates over the rows without loading all of them in memory
+
+        The rows are fetched in batches from the server while iterating.
+        The connection of the thread stays in use until the iteration ends.
+
+        Attributes:
+            query:
+                The SQL query.
+            params:
+                The list of parameters to be passed to the query.
+                This atribute is optional
+            batch_size:
+                The number of rows fetched from the server at once.
+            as_dict:
+                If false the rows are returned as tuples.
+
+        Returns:
+            A generator of dicts with the data fetched
+        """
+
+        started = time.perf_counter()
+        cur = self.con.cursor()
+        cur.execute(query, params)
+        self._local.used = True
+
+        coumns_names = [row[0] for row in cur.description]
+        rows = 0
+
+        try:
+            while True:
+                data = cur.fetchmany(batch_size)
+                if not data:
+                    break
+                rows += len(data)
+
+                if not as_dict:
+                    yield from data
+                    continue
+
+                for row in data:
+                    yield {coumns_names[idx]: row[idx] for idx in range(len(row))}
+        finally:
+            cur.close()
+            self._notify("iter_rows", started, rows)
+
     def fetchone_as_dict(self, query: str, params: list = []) -> dict:
         """Fetch one rows from the database
 
@@ -95,12 +685,13 @@ class FDBHandler(metaclass=Singleton):
             A dict the the data fetched
         """
 
-        cur = self.con.cursor()
-        cur.execute(query, params)
+        started = time.perf_counter()
+        cur = self._execute(query, params)
         coumns_names = [row[0] for row in cur.description]
 
         data = cur.fetchone()
         cur.close()
+        self._notify("fetchone_as_dict", started, 0 if data is None else 1)
 
         return {coumns_names[idx]: data[idx] for idx in range(len(data))}
 
@@ -111,201 +702,827 @@ class FDBHandler(metaclass=Singleton):
         like updates or creations.
 
         Attributes:
-            query:
-                The SQL query.
-            params:
-                The list of parameters to be passed to the query.
-                This atribute is optional
+            query:
+                The SQL query.
+            params:
+                The list of parameters to be passed to the query.
+                This atribute is optional
+        """
+
+        started = time.perf_counter()
+        cur = self._execute(query, params)
+        cur.close()
+        self._notify("execute_query", started)
+
+    def execute_many(self, query: str, params_list: List[list]) -> None:
+        """Executes the same query for each list of parameters
+
+        The query is prepared once and executed for all the parameters,
+        inside the current transaction.
+
+        Attributes:
+            query:
+                The SQL query.
+            params_list:
+                The list with the parameters of each execution.
+        """
+
+        started = time.perf_counter()
+        cur, prepared = self._prepare(self.con, query)
+        cur.executemany(prepared, params_list)
+        self._local.used = True
+        cur.close()
+        self._notify("execute_many", started)
+
+    def commit(self) -> None:
+        """Commits the work done to databse"""
+
+        started = time.perf_counter()
+        self.con.commit()
+        self._local.used = False
+        self._notify("commit", started)
+
+        callbacks = getattr(self._local, "after_commit", [])
+        self._local.after_commit = []
+        for callback in callbacks:
+            callback()
+
+    def rollback(self) -> None:
+        """Rolls back the work done since the last commit"""
+
+        self.con.rollback()
+        self._local.used = False
+        self._local.after_commit = []
+
+
+class Column:
+    """The base class to represent columns inside the database.
+
+    Attributes:
+        is_primary_key:
+            Setted if the column is a primary key.
+        use_generator:
+            Setted if the column uses a generator.
+        use_table_codigo:
+            Setted if the column is refered on the codigo table
+        data_type:
+            The python type of the column values, like Decimal or datetime.
+            Used to compile the serializer of the model,
+            the columns without it are checked value by value.
+    """
+
+    def __init__(
+        self,
+        is_primary_key: bool = False,
+        use_generator: str = None,
+        use_table_codigo: int = None,
+        data_type: type = None,
+    ) -> None:
+        self.is_primary_key = is_primary_key
+        self.use_generator = use_generator
+        self.use_table_codigo = use_table_codigo
+        self.data_type = data_type
+
+
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def convert_value(value):
+    """Converts a database value to a JSON value"""
+
+    if isinstance(value, Decimal):
+        return float(value)
+    elif isinstance(value, datetime):
+        return value.strftime(DATETIME_FORMAT)
+    return value
+
+
+def convert_decimal(value):
+    return None if value is None else float(value)
+
+
+def convert_datetime(value):
+    return value.strftime(DATETIME_FORMAT) if isinstance(value, datetime) else value
+
+
+CONVERTERS = {
+    Decimal: convert_decimal,
+    float: convert_decimal,
+    datetime: convert_datetime,
+    str: None,
+    int: None,
+    bool: None,
+}
+
+
+class ModelMeta(type):
+    """Model metaclass
+
+    Compiles the model metadata once, when the class is created.
+    It reads the Column attributes to build the columns, the primary key
+    and the SQL statements used by the FDBModel methods.
+
+    When the class sets __cache_size__ it also gets a LRUCache for its lookups,
+    with items valid for __cache_ttl__ seconds.
+    """
+
+    cached_models = []
+
+    select_templates = {
+        "select": """
+        SELECT
+            {}
+        FROM
+            {}
+        """,
+        "select_first": """
+        SELECT FIRST ?
+            {}
+        FROM
+            {}
+        """,
+        "select_page": """
+        SELECT FIRST ? SKIP ?
+            {}
+        FROM
+            {}
+        """,
+    }
+
+    def __new__(mcs, name: str, bases: tuple, namespace: dict) -> ModelMeta:
+        """Replaces the Column attributes by slots
+
+        The objects only store the columns values on slots,
+        without a __dict__ for each row.
+        """
+
+        column_specs = {
+            key: value for key, value in namespace.items() if isinstance(value, Column)
+        }
+
+        namespace = {
+            key: value for key, value in namespace.items() if key not in column_specs
+        }
+        namespace.setdefault("__slots__", tuple(column_specs))
+
+        cls = super().__new__(mcs, name, bases, namespace)
+        cls._column_specs = column_specs
+        return cls
+
+    def __init__(cls, name: str, bases: tuple, namespace: dict) -> None:
+        super().__init__(name, bases, namespace)
+
+        cls._columns = list(cls._column_specs)
+        cls._primary_key = [
+            key for key, value in cls._column_specs.items() if value.is_primary_key
+        ]
+        cls._update_columns = [
+            key for key in cls._columns if key not in cls._primary_key
+        ]
+        cls._statements = {}
+
+        cls._cache = None
+        if namespace.get("__cache_size__"):
+            cls._cache = LRUCache(
+                namespace["__cache_size__"], namespace.get("__cache_ttl__", 30)
+            )
+            ModelMeta.cached_models.append(cls)
+
+        init_params = list(inspect.signature(cls.__init__).parameters)[1:]
+        cls._positional_init = init_params == cls._columns
+
+        if cls.__tablename__ and cls._columns:
+            cls._compile_statements()
+        cls._compile_serializer()
+
+    def _from_row(cls, row: tuple, columns: Tuple[str] = None) -> FDBModel:
+        """Builds the object straight from a row tuple of the table columns
+
+        When the row only has some columns, passed on columns,
+        the other ones are setted as None.
+        """
+
+        if columns:
+            values = dict.fromkeys(cls._columns)
+            values.update(zip(columns, row))
+            return cls(**values)
+
+        if cls._positional_init:
+            return cls(*row)
+        return cls(**dict(zip(cls._columns, row)))
+
+    def _compile_serializer(cls) -> None:
+        """Builds the function that converts the objects to JSON dicts
+
+        The columns are read at once with an attrgetter,
+        and only the columns that need it are converted,
+        by the converter of their data_type.
+        """
+
+        columns = list(cls._column_specs)
+        converters = [
+            CONVERTERS.get(spec.data_type, convert_value)
+            for spec in cls._column_specs.values()
+        ]
+        converted = [
+            (idx, converter) for idx, converter in enumerate(converters) if converter
+        ]
+
+        if len(columns) > 1:
+            getter = attrgetter(*columns)
+        else:
+            getters = [attrgetter(column) for column in columns]
+            getter = lambda obj: [get(obj) for get in getters]
+
+        def serializer(obj: FDBModel) -> dict:
+            values = list(getter(obj))
+            for idx, converter in converted:
+                values[idx] = converter(values[idx])
+            return dict(zip(columns, values))
+
+        cls._serializer = staticmethod(serializer)
+
+    def _compile_statements(cls) -> None:
+        """Builds the statements that only depends on the table and columns"""
+
+        for name, template in ModelMeta.select_templates.items():
+            cls._statements[name] = template.format(
+                ", ".join(cls._columns), cls.__tablename__
+            )
+
+        if cls._primary_key:
+            cls._statements["find_by_key"] = (
+                cls._statements["select"] + f" WHERE {cls._primary_key[0]} = ?"
+            )
+
+            cls._statements["update"] = """
+        UPDATE
+            {}
+        SET
+            {}
+        WHERE
+            {}
+        """.format(
+                cls.__tablename__,
+                ", ".join([key + " = ?" for key in cls._update_columns]),
+                " AND ".join([key + " = ?" for key in cls._primary_key]),
+            )
+
+
+class FDBModel(metaclass=ModelMeta):
+    """Base model for ORM class heritance
+
+    The basic use of this class is to build querys based on class heritance.
+    It gets all the atributes used on the classes and build querys based on them,
+    returning the objects as classes.
+
+    When setuping the class,
+    the __tablename__ must be setted with the table name on the database.
+    The objects only store the columns, on slots, so they don't accept other attributes.
+    """
+
+    __slots__ = ()
+    __tablename__ = None
+    __base_limit = 50
+    __in_limit = 1500  # Firebird limit of values inside a IN list
+
+    @classmethod
+    def all(
+        cls: Type[T],
+        page=None,
+        limit=None,
+        keyset: bool = False,
+        after=None,
+        columns: List[str] = None,
+    ) -> List[T]:
+        """Return objects for all rows in the table
+
+        Attributes:
+            page:
+                The page that is going to be fetched.
+                This attribute is optional.
+            limit:
+                The number of rows to be fetched on that page.
+                This attribute is optional.
+            keyset:
+                If true paginates by the primary key instead of the page,
+                fetching the rows after the key passed on after.
+            after:
+                The last key of the previous page when using keyset.
+                This attribute is optional.
+            columns:
+                The only columns to be selected, the others are setted as None.
+                This attribute is optional.
+
+        Returns:
+            A list of objects with the data fetched
+        """
+
+        columns = cls._check_columns(columns)
+
+        if keyset:
+            query, params = cls._keyset_query([], [], limit, after, columns)
+        else:
+            query, params = cls._basic_query(page, limit, columns)
+
+        res = FDBHandler().fetchall(query, params)
+
+        return [cls._from_row(row, columns) for row in res]
+
+    @classmethod
+    def find_by_key(
+        cls: Type[T], key_value: Union[str, int], columns: List[str] = None
+    ) -> T:
+        """Return one object for the finded row. The key value must be provided.
+
+        Attributes:
+            key_value:
+                The value to build the query uppon, setted as is_primary_key.
+            columns:
+                The only columns to be selected, the others are setted as None.
+                The objects with only some columns are not cached.
+                This attribute is optional.
+
+        Returns:
+            The object found.
+
+        Raises:
+            TypeError: When the class don't have any column as is_primary_key.
+        """
+
+        primary_key = cls._get_primary_key()
+
+        if not primary_key:
+            error = f"Primary key is missing for the class {cls.__class__.__name__}"
+            raise TypeError(error)
+
+        columns = cls._check_columns(columns)
+
+        if columns:
+            query = cls._select_query("select", columns)
+            query += f" WHERE {primary_key[0]} = ?"
+
+            res = FDBHandler().fetchone(query, [key_value])
+            return cls._from_row(res, columns) if res is not None else None
+
+        cache_key = ((primary_key[0], str(key_value)),)
+
+        cached = cls._cache_get(cache_key)
+        if cached is not None:
+            return cached
+
+        query = cls._statements["find_by_key"]
+
+        res = FDBHandler().fetchone(query, [key_value])
+
+        if res is None:
+            return None
+        return cls._cache_set(cache_key, cls._from_row(res))
+
+    @classmethod
+    def find_by_columns(
+        cls: Type[T],
+        page=None,
+        limit=None,
+        exact: bool = True,
+        keyset: bool = False,
+        after=None,
+        **kwargs,
+    ) -> List[T]:
+        """Finds and return objects rows in the table.
+
+        Attributes:
+            page:
+                The page that is going to be fetched.
+                This attribute is optional.
+            limit:
+                The number of rows to be fetched on that page.
+                This attribute is optional.
+            exact:
+                If true querys the database with exact values,
+                if false makes a search by word.
+            keyset:
+                If true paginates by the primary key instead of the page,
+                fetching the rows after the key passed on after.
+            after:
+                The last key of the previous page when using keyset.
+                This attribute is optional.
+            kwargs:
+                Any of the columns passed as attributes on the object class.
+
+        Returns:
+            A list of objects with the data fetched.
+        """
+
+        if kwargs:
+            columns = cls._get_columns()
+
+            cache_key = None
+            if exact and not page and not keyset:
+                cache_key = tuple(
+                    sorted((key, str(kwargs[key])) for key in kwargs if key in columns)
+                )
+
+                cached = cls._cache_get(cache_key)
+                if cached is not None:
+                    return cached
+
+            wheres = []
+            params = []
+
+            for key in kwargs:
+                if key in columns:
+                    q, p = cls._build_where(kwargs[key], key, exact)
+                    wheres.append(q)
+                    params += p
+
+            if keyset:
+                query, params = cls._keyset_query(wheres, params, limit, after)
+            else:
+                query, pagination = cls._basic_query(page, limit)
+                query += "WHERE " + " AND ".join(wheres)
+                params = pagination + params
+
+            res = FDBHandler().fetchall(query, params)
+            return cls._cache_set(cache_key, [cls._from_row(row) for row in res])
+        else:
+            return None
+
+    @classmethod
+    def iter_objects(cls: Type[T], batch_size: int = 500, **kwargs) -> Iterator[T]:
+        """Iterates over the rows of the table without loading all of them in memory
+
+        The rows are ordered by the primary key, when the class have one.
+
+        Attributes:
+            batch_size:
+                The number of rows fetched from the server at once.
+            kwargs:
+                Any of the columns passed as attributes on the object class,
+                used as exact filters.
+
+        Returns:
+            A generator of objects with the data fetched.
+        """
+
+        columns = cls._get_columns()
+
+        query = cls._statements["select"]
+        wheres = []
+        params = []
+
+        for key in kwargs:
+            if key in columns:
+                q, p = cls._build_where(kwargs[key], key)
+                wheres.append(q)
+                params += p
+
+        if wheres:
+            query += "WHERE " + " AND ".join(wheres)
+        if cls._get_primary_key():
+            query += " ORDER BY " + ", ".join(cls._get_primary_key())
+
+        for row in FDBHandler().iter_rows(query, params, batch_size, as_dict=False):
+            yield cls._from_row(row)
+
+    @classmethod
+    def find_by_values(
+        cls: Type[T], column: str, values: list, columns: List[str] = None, **kwargs
+    ) -> List[T]:
+        """Finds the rows where the column matches any of the values.
+
+        The values are sent on chunked IN lists, keeping the number of querys
+        constant for a set of rows instead of one query per row.
+
+        Attributes:
+            column:
+                The column that the values will be searched.
+            values:
+                The list of values to be searched.
+            columns:
+                The only columns to be selected, the others are setted as None.
+                This attribute is optional.
+            kwargs:
+                Any of the columns passed as attributes on the object class,
+                used as exact filters.
+
+        Returns:
+            A list of objects with the data fetched.
+
+        Raises:
+            TypeError: When the column is not a column of the class.
+        """
+
+        selected = cls._check_columns(columns)
+        columns = cls._get_columns()
+
+        if column not in columns:
+            error = f"Column {column} is missing for the class {cls.__name__}"
+            raise TypeError(error)
+
+        values = list(dict.fromkeys(values))  # Remove duplicates keeping the order
+
+        wheres = []
+        params = []
+
+        for key in kwargs:
+            if key in columns:
+                q, p = cls._build_where(kwargs[key], key)
+                wheres.append(q)
+                params += p
+
+        res = []
+        limit = cls.__in_limit
+
+        for start in range(0, len(values), limit):
+            chunk = values[start : start + limit]
+
+            query = cls._select_query("select", selected)
+            query += "WHERE " + " AND ".join(
+                [f"{column} IN ({', '.join(['?' for _ in chunk])})"] + wheres
+            )
+
+            res += FDBHandler().fetchall(query, chunk + params)
+
+        return [cls._from_row(row, selected) for row in res]
+
+    def update(self) -> None:
+        """Updates the database with the object.
+
+        It don't commit the database. It must be done by hand.
+        """
+
+        if "_on_update" in self.__class__.__dict__:
+            self._on_update()
+
+        query = self._update_query()
+
+        FDBHandler().execute_query(query, self._update_params())
+        self._invalidate_cache()
+
+    @classmethod
+    def update_many(cls, objects: List[T]) -> None:
+        """Updates the database with all the objects.
+
+        The update query is prepared once and executed for each object.
+        It don't commit the database. It must be done by hand.
+
+        Attributes:
+            objects:
+                The objects to be updated.
+        """
+
+        if not objects:
+            return
+
+        query = cls._update_query()
+
+        for obj in objects:
+            if "_on_update" in cls.__dict__:
+                obj._on_update()
+
+        FDBHandler().execute_many(query, [obj._update_params() for obj in objects])
+
+        for obj in objects:
+            obj._invalidate_cache()
+
+    @classmethod
+    def _update_query(cls) -> str:
+        """Gets the update query of the class.
+
+        Raises:
+            TypeError: When the class don't have any column as is_primary_key.
+        """
+
+        if not cls._get_primary_key():
+            error = f"Primary key is missing for the class {cls.__name__}"
+            raise TypeError(error)
+
+        return cls._statements["update"]
+
+    def _update_params(self) -> list:
+        """Gets the parameters of the update query for the object."""
+
+        params = [
+            getattr(self, column) for column in self._update_columns
+        ]  # Secure way to get the data from the columns using only Columns class
+
+        for key in self._get_primary_key():
+            params.append(getattr(self, key))
+
+        return params
+
+    def insert(self) -> None:
+        """Insert a new row to the database.
+
+        It don't commit the database. It must be done by hand.
+        """
+
+        if "_on_insert" in self.__class__.__dict__:
+            self._on_insert()
+
+        for key, value in list(self._get_next_keys().items()):
+            setattr(self, key, value)
+
+        data = {column: getattr(self, column) for column in self._get_columns()}
+        columns = tuple(key for key, value in data.items() if value != None)
+
+        FDBHandler().execute_query(
+            self._insert_query(columns), [data[key] for key in columns]
+        )
+        self._invalidate_cache()
+
+    @classmethod
+    def insert_many(cls, objects: List[T]) -> None:
+        """Insert new rows to the database for all the objects.
+
+        The keys come from the blocks reserved by the KeyAllocator,
+        and each insert query is prepared once for the objects with the same columns.
+        It don't commit the database. It must be done by hand.
+
+        Attributes:
+            objects:
+                The objects to be inserted.
         """
 
-        cur = self.con.cursor()
-        cur.execute(query, params)
-        cur.close()
+        batches = defaultdict(list)
 
-    def commit(self) -> None:
-        """Commits the work done to databse"""
+        for obj in objects:
+            if "_on_insert" in cls.__dict__:
+                obj._on_insert()
 
-        self.con.commit()
+            for key, value in list(cls._get_next_keys().items()):
+                setattr(obj, key, value)
 
+            data = {column: getattr(obj, column) for column in cls._get_columns()}
+            columns = tuple(key for key, value in data.items() if value != None)
+            batches[columns].append([data[key] for key in columns])
 
-class FDBModel:
-    """Base model for ORM class heritance
+        for columns, params_list in batches.items():
+            FDBHandler().execute_many(cls._insert_query(columns), params_list)
 
-    The basic use of this class is to build querys based on class heritance.
-    It gets all the atributes used on the classes and build querys based on them,
-    returning the objects as classes.
+        for obj in objects:
+            obj._invalidate_cache()
 
-    When setuping the class,
-    the __tablename__ must be setted with the table name on the database.
-    """
+    @classmethod
+    def cache_stats(cls) -> dict:
+        """Returns the counters of the class cache, or None when it has no cache."""
 
-    __tablename__ = None
-    __base_limit = 50
+        if cls._cache is None:
+            return None
+        return cls._cache.stats()
 
     @classmethod
-    def all(cls: Type[T], page=None, limit=None) -> List[T]:
-        """Return objects for all rows in the table
-
-        Attributes:
-            page:
-                The page that is going to be fetched.
-                This attribute is optional.
-            limit:
-                The number of rows to be fetched on that page.
-                This attribute is optional.
+    def _cache_get(cls, key: tuple) -> Union[T, List[T]]:
+        """Gets a copy of the objects cached for the lookup key.
 
         Returns:
-            A list of objects with the data fetched
+            The cached objects, or None when not cached or the class has no cache.
         """
 
-        query = cls._basic_query(page, limit)
-
-        res = FDBHandler().fetchall_as_dict(query)
+        if cls._cache is None or key is None:
+            return None
 
-        return [cls(**row) for row in res]
+        cached = cls._cache.get(cls._database_key(key))
+        if isinstance(cached, list):
+            return [copy.copy(obj) for obj in cached]
+        return copy.copy(cached)
 
     @classmethod
-    def find_by_key(cls: Type[T], key_value: Union[str, int]) -> T:
-        """Return one object for the finded row. The key value must be provided.
-
-        Attributes:
-            key_value:
-                The value to build the query uppon, setted as is_primary_key.
+    def _cache_set(cls, key: tuple, value: Union[T, List[T]]) -> Union[T, List[T]]:
+        """Caches a copy of the objects found for the lookup key.
 
         Returns:
-            The object found.
+            The value, unchanged.
+        """
 
-        Raises:
-            TypeError: When the class don't have any column as is_primary_key.
+        if cls._cache is not None and key is not None:
+            key = cls._database_key(key)
+            if isinstance(value, list):
+                cls._cache.set(key, [copy.copy(obj) for obj in value])
+            else:
+                cls._cache.set(key, copy.copy(value))
+        return value
+
+    @staticmethod
+    def _database_key(key: tuple) -> tuple:
+        """Adds the database of the current company to the lookup key.
+
+        So the companies on their own databases don't share the cached objects.
+        The key is unchanged on the FIREBIRDPATH database.
         """
 
-        primary_key = cls._get_primary_key()
+        database = FDBHandler().database
+        if database is None:
+            return key
+        return key + (("__database__", database),)
 
-        if not primary_key:
-            error = f"Primary key is missing for the class {cls.__class__.__name__}"
-            raise TypeError(error)
+    def _invalidate_cache(self) -> None:
+        """Removes the cached lookups that could return this object.
 
-        query = cls._basic_query()
-        query += f" WHERE {primary_key[0]} = ?"
+        A lookup is removed when all its columns match the object values.
+        It's done now and again after the commit,
+        so lookups made before the commit don't keep the old values.
+        """
+
+        cache = self._cache
+        if cache is None:
+            return
 
-        res = FDBHandler().fetchone_as_dict(query, [key_value])
+        values = {column: str(getattr(self, column)) for column in self._get_columns()}
+        values["__database__"] = FDBHandler().database
 
-        return cls(**res)
+        def invalidate():
+            cache.delete_where(
+                lambda key: all(values.get(column) == value for column, value in key)
+            )
+
+        invalidate()
+        FDBHandler().after_commit(invalidate)
 
     @classmethod
-    def find_by_columns(
-        cls: Type[T], page=None, limit=None, exact: bool = True, **kwargs
-    ) -> List[T]:
-        """Finds and return objects rows in the table.
+    def _insert_query(cls, columns: Tuple[str]) -> str:
+        """Builds the insert query for the columns, caching it on the class.
 
         Attributes:
-            page:
-                The page that is going to be fetched.
-                This attribute is optional.
-            limit:
-                The number of rows to be fetched on that page.
-                This attribute is optional.
-            exact:
-                If true querys the database with exact values,
-                if false makes a search by word.
-            kwargs:
-                Any of the columns passed as attributes on the object class.
+            columns:
+                The columns that will receive values.
 
         Returns:
-            A list of objects with the data fetched.
+            The query as a string.
         """
 
-        if kwargs:
-            columns = cls._get_columns()
-
-            wheres = []
-            params = []
+        key = ("insert", columns)
 
-            for key in kwargs:
-                if key in columns:
-                    q, p = cls._build_where(kwargs[key], key, exact)
-                    wheres.append(q)
-                    params += p
+        if key not in cls._statements:
+            cls._statements[key] = """
+        INSERT INTO
+            {} ({})
+        VALUES
+            ({})
+        """.format(
+                cls.__tablename__,
+                ", ".join(columns),
+                ", ".join(["?" for _ in columns]),
+            )
 
-            query = cls._basic_query(page, limit)
-            query += "WHERE " + " AND ".join(wheres)
+        return cls._statements[key]
 
-            res = FDBHandler().fetchall_as_dict(query, params)
-            return [cls(**row) for row in res]
-        else:
-            return None
+    @classmethod
+    def _select_query(cls, statement: str, columns: Tuple[str] = None) -> str:
+        """Gets the select statement for only the columns, caching it on the class.
 
-    def update(self) -> None:
-        """Updates the database with the object.
+        Attributes:
+            statement:
+                The name of the statement, select, select_first or select_page.
+            columns:
+                The columns to be selected, all of them when not passed.
 
-        It don't commit the database. It must be done by hand.
+        Returns:
+            The query as a string.
         """
 
-        if "_on_update" in self.__class__.__dict__:
-            self._on_update()
-
-        data = {
-            column: self.__dict__[column] for column in self._get_columns()
-        }  # Secure way to get the data from the columns using only Columns class
-
-        primary_key = self._get_primary_key()
+        if not columns:
+            return cls._statements[statement]
 
-        if not primary_key:
-            error = f"Primary key is missing for the class {self.__class__.__name__}"
-            raise TypeError(error)
+        key = (statement, columns)
 
-        for key in primary_key:
-            del data[key]
+        if key not in cls._statements:
+            cls._statements[key] = ModelMeta.select_templates[statement].format(
+                ", ".join(columns), cls.__tablename__
+            )
 
-        set_query = [f"{key} = ?" for key in data.keys()]
-        params = list(data.values())
-
-        query = """
-        UPDATE
-            {}
-        SET
-            {}
-        WHERE
-            {}
-        """.format(
-            self.__tablename__,
-            ", ".join(set_query),
-            " AND ".join([key + " = ?" for key in primary_key]),
-        )
+        return cls._statements[key]
 
-        for key in primary_key:
-            params.append(self.__dict__[key])
+    @classmethod
+    def _check_columns(cls, columns: List[str] = None) -> Tuple[str]:
+        """Checks the columns to be selected.
 
-        FDBHandler().execute_query(query, params)
+        The primary key is always selected, so the objects can still be found.
 
-    def insert(self) -> None:
-        """Insert a new row to the database.
+        Returns:
+            The columns as a tuple, or None when all the columns are selected.
 
-        It don't commit the database. It must be done by hand.
+        Raises:
+            TypeError: When any of the columns is not a column of the class.
         """
 
-        if "_on_insert" in self.__class__.__dict__:
-            self._on_insert()
-
-        for key, value in list(self._get_next_keys().items()):
-            self.__dict__[key] = value
-
-        data = {column: self.__dict__[column] for column in self._get_columns()}
+        if not columns:
+            return None
 
-        query = """
-        INSERT INTO
-            {} ({})
-        VALUES
-            ({})
-        """.format(
-            self.__tablename__,
-            ", ".join([key for key, value in data.items() if value != None]),
-            ", ".join(["?" for _, value in data.items() if value != None]),
-        )
+        for column in columns:
+            if column not in cls._columns:
+                error = f"Column {column} is missing for the class {cls.__name__}"
+                raise TypeError(error)
 
-        FDBHandler().execute_query(
-            query, [value for _, value in data.items() if value != None]
-        )
+        selected = [
+            column
+            for column in cls._columns
+            if column in columns or column in cls._primary_key
+        ]
+        if selected == cls._columns:
+            return None
+        return tuple(selected)
 
     @classmethod
     def _get_next_keys(cls) -> dict:
@@ -318,37 +1535,33 @@ class FDBModel:
         """
 
         key_columns = cls._get_primary_key()
+        allocator = KeyAllocator()
 
         res = {}
 
         for key in key_columns:
-            if cls.__dict__[key].use_table_codigo:
-                codigo = Codigo.find_by_columns(
-                    NOMETABELA=cls.__tablename__, NOMECAMPO=key
-                )
-                if codigo:
-                    codigo = codigo[0]
-                    res[key] = str(codigo.ULTIMOCODIGO).rjust(
-                        cls.__dict__[key].use_table_codigo, "0"
+            if cls._column_specs[key].use_table_codigo:
+                codigo = allocator.next_codigo(cls.__tablename__, key)
+                if codigo is not None:
+                    res[key] = str(codigo).rjust(
+                        cls._column_specs[key].use_table_codigo, "0"
                     )
-                    codigo.ULTIMOCODIGO += 1
-                    codigo.update()
-                    codigo.commit()
 
-            elif cls.__dict__[key].use_generator:
-                query = f"""
-                SELECT NEXT VALUE FOR {cls.__dict__[key].use_generator} FROM RDB$DATABASE
-                """
-                res[key] = FDBHandler.fetchone_as_dict(query)["GEN_ID"]
-                cls.commit()
+            elif cls._column_specs[key].use_generator:
+                res[key] = allocator.next_generator(
+                    cls._column_specs[key].use_generator
+                )
 
         return res
 
     @classmethod
-    def _basic_query(cls, page: int = None, limit: int = None) -> str:
-        """Builds the most basic query.
+    def _basic_query(
+        cls, page: int = None, limit: int = None, columns: Tuple[str] = None
+    ) -> Tuple[str, list]:
+        """Gets the most basic query.
 
-        Build the most basic query without any filters.
+        Gets the most basic query without any filters,
+        compiled when the class was created.
 
         Attributes:
             page:
@@ -357,25 +1570,114 @@ class FDBModel:
             limit:
                 The number of rows to be fetched on that page.
                 This attribute is optional.
+            columns:
+                The columns to be selected, all of them when not passed.
+                This attribute is optional.
 
         Returns:
-            The query as a string.
+            The query as a string and the list of parameters.
         """
 
-        return """
-        SELECT {}
-            {}
-        FROM
-            {}
-        """.format(
-            cls._build_pagination_query(page, limit),
-            ", ".join([column for column in cls._get_columns()]),
-            cls.__tablename__,
-        )
+        params = cls._build_pagination_query(page, limit)
+
+        if params:
+            return cls._select_query("select_page", columns), params
+        return cls._select_query("select", columns), params
+
+    @classmethod
+    def _keyset_query(
+        cls,
+        wheres: List[str],
+        params: list,
+        limit: int = None,
+        after=None,
+        columns: Tuple[str] = None,
+    ) -> Tuple[str, list]:
+        """Builds a query paginated by the primary key.
+
+        Instead of skipping the rows of the previous pages,
+        it seeks the rows after the last key, so the page depth don't matter.
+
+        Attributes:
+            wheres:
+                The filters of the query.
+            params:
+                The parameters of the filters.
+            limit:
+                The number of rows to be fetched on that page.
+                This attribute is optional.
+            after:
+                The last key of the previous page.
+                This attribute is optional.
+            columns:
+                The columns to be selected, all of them when not passed.
+                This attribute is optional.
+
+        Returns:
+            The query as a string and the list of parameters.
+
+        Raises:
+            TypeError: When the class don't have one column as is_primary_key.
+        """
+
+        primary_key = cls._get_primary_key()
+
+        if len(primary_key) != 1:
+            error = f"Keyset pagination needs a single primary key on the class {cls.__name__}"
+            raise TypeError(error)
+
+        params = [limit or cls.__base_limit] + params
+
+        if after is not None:
+            wheres = wheres + [f"{primary_key[0]} > ?"]
+            params.append(after)
+
+        query = cls._select_query("select_first", columns)
+        if wheres:
+            query += "WHERE " + " AND ".join(wheres)
+        query += f" ORDER BY {primary_key[0]}"
+
+        return query, params
+
+    @classmethod
+    def next_cursor(cls, rows: list, limit: int = None) -> str:
+        """Builds the opaque cursor for the page after the rows.
+
+        Attributes:
+            rows:
+                The objects of the current page.
+            limit:
+                The number of rows fetched on that page.
+                This attribute is optional.
+
+        Returns:
+            The cursor as a string, or None when it's the last page.
+        """
+
+        if not rows or len(rows) < (limit or cls.__base_limit):
+            return None
+
+        return cls.encode_cursor(getattr(rows[-1], cls._get_primary_key()[0]))
+
+    @staticmethod
+    def encode_cursor(value: Union[str, int]) -> str:
+        """Encodes the value as an opaque cursor."""
+
+        return base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> Union[str, int]:
+        """Reads the value from a cursor built by encode_cursor.
+
+        Raises:
+            ValueError: When the cursor is not valid.
+        """
+
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()))
 
     @classmethod
-    def _build_pagination_query(cls, page: int, limit: int = None) -> str:
-        """Builds the query part responsable for pagination.
+    def _build_pagination_query(cls, page: int, limit: int = None) -> list:
+        """Builds the parameters responsable for pagination.
 
         Attributes:
             page:
@@ -386,17 +1688,17 @@ class FDBModel:
                 This attribute is optional.
 
         Returns:
-            The query part as a string.
+            The FIRST and SKIP parameters, or a empty list without pagination.
         """
 
         if page:
             if page < 1:
-                return ""
+                return []
 
             if not limit:
                 limit = cls.__base_limit
-            return f"first {limit} skip {limit * (page - 1)}"
-        return ""
+            return [limit, limit * (page - 1)]
+        return []
 
     @classmethod
     def _get_primary_key(cls) -> str:
@@ -406,11 +1708,7 @@ class FDBModel:
             The key as string.
         """
 
-        return [
-            key
-            for key, value in cls.__dict__.items()
-            if isinstance(value, Column) and value.is_primary_key
-        ]
+        return cls._primary_key
 
     @classmethod
     def _get_columns(cls) -> list:
@@ -420,7 +1718,7 @@ class FDBModel:
             The list of columns as string.
         """
 
-        return [key for key, value in cls.__dict__.items() if isinstance(value, Column)]
+        return cls._columns
 
     @staticmethod
     def convert_to_JSON(data: dict) -> str:
@@ -434,14 +1732,15 @@ class FDBModel:
             The data formated as json.
         """
 
-        def data_type_handler(x):
-            if isinstance(x, Decimal):
-                return float(x)
-            elif isinstance(x, datetime):
-                return x.strftime("%Y-%m-%d %H:%M:%S")
-            return x
+        return {key: convert_value(value) for key, value in data.items()}
+
+    def serialize(self) -> dict:
+        """Converts the columns of the object to a JSON dict
 
-        return {key: data_type_handler(value) for key, value in data.items()}
+        Uses the serializer compiled from the columns data_type.
+        """
+
+        return self._serializer(self)
 
     @staticmethod
     def _build_where(
@@ -468,9 +1767,10 @@ class FDBModel:
         if exact:
             return f"{column} = ?", [value]
         else:
-            splited = value.split(" ")
+            splited = value.split()
             for word in splited:
-                query.append(f"{column} SIMILAR TO '%{word}%'")
+                query.append(f"{column} CONTAINING ?")
+                params.append(word)
 
             return " AND ".join(query), params
 
@@ -481,30 +1781,8 @@ class FDBModel:
         FDBHandler().commit()
 
     def __repr__(self) -> str:
-        return f"Class {self.__class__.__name__} with {self.__dict__}"
-
-
-class Column:
-    """The base class to represent columns inside the database.
-
-    Attributes:
-        is_primary_key:
-            Setted if the column is a primary key.
-        use_generator:
-            Setted if the column uses a generator.
-        use_table_codigo:
-            Setted if the column is refered on the codigo table
-    """
-
-    def __init__(
-        self,
-        is_primary_key: bool = False,
-        use_generator: str = None,
-        use_table_codigo: int = None,
-    ) -> None:
-        self.is_primary_key = is_primary_key
-        self.use_generator = use_generator
-        self.use_table_codigo = use_table_codigo
+        values = {column: getattr(self, column, None) for column in self._get_columns()}
+        return f"Class {self.__class__.__name__} with {values}"
 
 
 class Codigo(FDBModel):
@@ -527,3 +1805,119 @@ class Codigo(FDBModel):
         self.NOMETABELA = NOMETABELA
         self.NOMECAMPO = NOMECAMPO
         self.ULTIMOCODIGO = ULTIMOCODIGO
+
+
+class KeyAllocator(metaclass=Singleton):
+    """Allocates sequencial keys in blocks
+
+    Instead of reading and updating the CODIGO table for every insert,
+    it reserves a block of codes on a single transaction and hands them out from memory.
+    Generators are reserved the same way, with GEN_ID.
+
+    The codes of a block not used before the server stops are lost,
+    leaving gaps on the sequence.
+
+    Attributes:
+        block_size:
+            The number of codes reserved at once.
+            Defaults to FIREBIRD_KEY_BLOCK on .env or 20
+    """
+
+    def __init__(self, block_size: int = None) -> None:
+        self.block_size = block_size or config(
+            "FIREBIRD_KEY_BLOCK", default=20, cast=int
+        )
+
+        self._blocks = {}  # (database, key): [next code, end of the block]
+        self._locks = defaultdict(threading.Lock)
+        self._locks_lock = threading.Lock()
+
+    def next_codigo(self, table: str, column: str) -> int:
+        """Gets the next code of the column on the CODIGO table.
+
+        Returns:
+            The code, or None when the column is not on the CODIGO table.
+        """
+
+        return self._next(("CODIGO", table, column), self._reserve_codigo)
+
+    def next_generator(self, generator: str) -> int:
+        """Gets the next value of the generator."""
+
+        return self._next(("GENERATOR", generator), self._reserve_generator)
+
+    def _next(self, key: tuple, reserve: Callable[..., Tuple[int, int]]) -> int:
+        """Hands out the next code of the block, reserving a new block when needed.
+
+        The blocks are kept by database, the codes of a company
+        are reserved on its own database.
+        """
+
+        handler = FDBHandler()
+        company = handler.company
+        key = (handler.database_of(company), *key)
+
+        with self._locks_lock:
+            lock = self._locks[key]
+
+        with lock:
+            block = self._blocks.get(key)
+
+            if not block or block[0] >= block[1]:
+                block = reserve(company, *key[2:])
+                if block is None:
+                    return None
+                block = self._blocks[key] = list(block)
+
+            code = block[0]
+            block[0] += 1
+            return code
+
+    def _reserve_codigo(self, company: str, table: str, column: str) -> Tuple[int, int]:
+        """Reserves a block on the CODIGO table.
+
+        It's done on its own connection, on the company database, and commited right away,
+        so it don't commit the work of the current transaction.
+
+        Returns:
+            The first code and the end of the block.
+        """
+
+        with FDBHandler().pool_for(company).connection() as con:
+            cur = con.cursor()
+            cur.execute(
+                """
+                UPDATE
+                    CODIGO
+                SET
+                    ULTIMOCODIGO = ULTIMOCODIGO + ?
+                WHERE
+                    NOMETABELA = ? AND NOMECAMPO = ?
+                RETURNING
+                    ULTIMOCODIGO
+                """,
+                [self.block_size, table, column],
+            )
+            row = cur.fetchone()
+            con.commit()
+
+        if not row:
+            return None
+        return row[0] - self.block_size, row[0]
+
+    def _reserve_generator(self, company: str, generator: str) -> Tuple[int, int]:
+        """Reserves a block of the generator.
+
+        Returns:
+            The first value and the end of the block.
+        """
+
+        with FDBHandler().pool_for(company).connection() as con:
+            cur = con.cursor()
+            cur.execute(
+                f"SELECT GEN_ID({generator}, ?) FROM RDB$DATABASE", [self.block_size]
+            )
+            last = cur.fetchone()[0]
+            con.commit()
+
+        return last - self.block_size + 1, last + 1
@@ -0,0 +1,95 @@
+from __future__ import annotations
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+import threading
+import time
+
+
+class LRUCache:
+    """Thread safe LRU cache with expiration
+
+    Keeps up to size items, removing the least recently used when full.
+    Items older than ttl seconds are treated as missing.
+
+    Attributes:
+        size:
+            The maximum number of items.
+        ttl:
+            The seconds an item stays valid.
+    """
+
+    def __init__(self, size: int = 1024, ttl: float = 30) -> None:
+        self.size = size
+        self.ttl = ttl
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._data = OrderedDict()  # key: (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Gets the item, or the default when missing or expired"""
+
+        with self._lock:
+            item = self._data.get(key)
+
+            if item is None or item[0] < time.monotonic():
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Stores the item, removing the least recently used when full"""
+
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: Hashable) -> None:
+        """Removes the item if stored"""
+
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Removes the items which key matches the predicate
+
+        Returns:
+            The number of items removed.
+        """
+
+        with self._lock:
+            keys = [key for key in self._data if predicate(key)]
+            for key in keys:
+                del self._data[key]
+            return len(keys)
+
+    def clear(self) -> None:
+        """Removes all the items"""
+
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        """Returns the counters of the cache"""
+
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "max_size": self.size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,182 @@
+from __future__ import annotations
+from decimal import Decimal
+from typing import Iterator, List, Tuple, Union
+import re
+import sqlite3
+import fdb
+
+sqlite3.register_adapter(Decimal, float)
+
+FIRST_SKIP = re.compile(r"SELECT\s+FIRST\s+(\?|\d+)(?:\s+SKIP\s+(\?|\d+))?", re.I)
+CONTAINING = re.compile(r"([\w.]+)\s+CONTAINING\s+\?", re.I)
+GEN_ID = re.compile(
+    r"SELECT\s+GEN_ID\((\w+),\s*(\?|-?\d+)\)\s+FROM\s+RDB\$DATABASE", re.I
+)
+RDB_DATABASE = re.compile(r"\s+FROM\s+RDB\$DATABASE", re.I)
+
+
+def connect(path: str, user: str = None, password: str = None) -> Connection:
+    """Opens a SQLite database with the same interface of fdb.connect
+
+    Used as a local stand-in of the Firebird server, by setting FIREBIRD_BACKEND=sqlite on .env.
+    The user and password are ignored.
+    """
+
+    try:
+        return Connection(path)
+    except sqlite3.Error as e:
+        raise fdb.DatabaseError(str(e)) from e
+
+
+def translate(query: str, params: list = []) -> Tuple[str, list]:
+    """Translates the Firebird dialect used by the server to SQLite
+
+    Converts FIRST and SKIP to LIMIT and OFFSET, moving their parameters to the end,
+    CONTAINING to a case insensitive instr and removes the RDB$DATABASE table.
+
+    Returns:
+        The query and the parameters on the new order.
+    """
+
+    params = list(params)
+
+    match = FIRST_SKIP.search(query)
+    if match:
+        first, skip = match.groups()
+        moved = [
+            params.pop(0) if value == "?" else int(value)
+            for value in (first, skip)
+            if value
+        ]
+
+        query = query[: match.start()] + "SELECT" + query[match.end() :]
+        query += " LIMIT ?" + (" OFFSET ?" if skip else "")
+        params += moved
+
+    query = CONTAINING.sub(r"instr(upper(\1), upper(?)) > 0", query)
+    query = RDB_DATABASE.sub("", query)
+
+    return query, params
+
+
+class PreparedStatement:
+    """The query returned by Cursor.prep, as on fdb"""
+
+    def __init__(self, sql: str) -> None:
+        self.sql = sql
+
+
+class Cursor:
+    """Cursor with the fdb.Cursor functions used by the FDBHandler"""
+
+    def __init__(self, connection: Connection) -> None:
+        self.connection = connection
+        self._cur = connection._con.cursor()
+
+    @property
+    def description(self) -> tuple:
+        return self._cur.description
+
+    def prep(self, query: str) -> PreparedStatement:
+        return PreparedStatement(query)
+
+    def execute(
+        self, query: Union[str, PreparedStatement], params: list = []
+    ) -> Cursor:
+        if isinstance(query, PreparedStatement):
+            query = query.sql
+
+        try:
+            match = GEN_ID.search(query)
+            if match:
+                self._gen_id(match, params)
+            else:
+                self._cur.execute(*translate(query, params))
+        except sqlite3.Error as e:
+            raise fdb.DatabaseError(str(e)) from e
+
+        return self
+
+    def executemany(
+        self, query: Union[str, PreparedStatement], params_list: List[list]
+    ) -> None:
+        if isinstance(query, PreparedStatement):
+            query = query.sql
+
+        try:
+            self._cur.executemany(
+                translate(query)[0], [list(params) for params in params_list]
+            )
+        except sqlite3.Error as e:
+            raise fdb.DatabaseError(str(e)) from e
+
+    def fetchone(self) -> tuple:
+        return self._cur.fetchone()
+
+    def fetchmany(self, size: int = 1) -> List[tuple]:
+        return self._cur.fetchmany(size)
+
+    def fetchall(self) -> List[tuple]:
+        return self._cur.fetchall()
+
+    def close(self) -> None:
+        """Does nothing, the cursors are reused by the prepared statements cache"""
+
+    def __iter__(self) -> Iterator[tuple]:
+        return iter(self._cur)
+
+    def _gen_id(self, match: re.Match, params: list) -> None:
+        """Emulates the generators on the RDB$GENERATORS table"""
+
+        generator, step = match.groups()
+        step = params[0] if step == "?" else int(step)
+
+        self._cur.execute(
+            "CREATE TABLE IF NOT EXISTS RDB$GENERATORS (NAME TEXT PRIMARY KEY, VALUE INTEGER)"
+        )
+        self._cur.execute(
+            """
+            INSERT INTO RDB$GENERATORS VALUES (?, ?)
+            ON CONFLICT (NAME) DO UPDATE SET VALUE = VALUE + excluded.VALUE
+            RETURNING VALUE
+            """,
+            [generator.upper(), step],
+        )
+
+
+class Connection:
+    """Connection with the fdb.Connection functions used by the FDBHandler"""
+
+    def __init__(self, path: str) -> None:
+        self._con = sqlite3.connect(
+            path, check_same_thread=False, detect_types=sqlite3.PARSE_DECLTYPES
+        )
+
+    @property
+    def closed(self) -> bool:
+        try:
+            self._con.total_changes
+        except sqlite3.ProgrammingError:
+            return True
+        return False
+
+    def cursor(self) -> Cursor:
+        try:
+            return Cursor(self)
+        except sqlite3.Error as e:
+            raise fdb.DatabaseError(str(e)) from e
+
+    def commit(self) -> None:
+        try:
+            self._con.commit()
+        except sqlite3.Error as e:
+            raise fdb.DatabaseError(str(e)) from e
+
+    def rollback(self) -> None:
+        try:
+            self._con.rollback()
+        except sqlite3.Error as e:
+            raise fdb.DatabaseError(str(e)) from e
+
+    def close(self) -> None:
+        self._con.close()
@@ -0,0 +1,56 @@
+import sys
+from flask import Flask, g, request
+from flask_jwt_extended import get_jwt, verify_jwt_in_request
+
+sys.path.insert(0, "./")
+from src.ORM.FDB_handler import FDBHandler
+
+
+def resolve_company() -> str:
+    """Gets the company of the request
+
+    The company is the CODEMPRESA claim of the token, when the token has it,
+    the CODEMPRESA parameter or the default company, CODEMPRESA on .env.
+
+    Returns:
+        The company.
+
+    Raises:
+        PermissionError: When the parameter is not the company of the token.
+    """
+
+    company = request.args.get("CODEMPRESA")
+
+    try:
+        claim = verify_jwt_in_request(optional=True) and get_jwt().get("CODEMPRESA")
+    except Exception:
+        claim = None  # The invalid tokens are refused by the endpoints that need them
+
+    if claim:
+        if company and company != str(claim):
+            raise PermissionError(company)
+        company = str(claim)
+
+    return company or FDBHandler().default_company
+
+
+def init_company(app: Flask) -> None:
+    """Resolves the company once per request, before the querys
+
+    The company is kept on g.CODEMPRESA and on the FDBHandler thread,
+    which routes the querys to the company database.
+    """
+
+    @app.before_request
+    def use_company():
+        try:
+            company = resolve_company()
+        except PermissionError:
+            return {"message": "Empresa não permitida para o usuário"}, 403
+
+        handler = FDBHandler()
+        if company not in handler.companies:
+            return {"message": "Empresa inválida"}, 400
+
+        g.CODEMPRESA = company
+        handler.use_company(company)
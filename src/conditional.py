@@ -0,0 +1,46 @@
+from datetime import datetime, timezone
+from typing import Tuple
+import hashlib
+from flask import Response, request
+from werkzeug.http import http_date
+
+
+def conditional(
+    validators: tuple, last_modified: datetime = None
+) -> Tuple[Response, dict]:
+    """Checks the conditional headers of the request against the validators
+
+    The ETag is a hash of the validators, values that change when the response changes.
+    If-None-Match is checked against it and, when not sent, If-Modified-Since against last_modified.
+
+    Attributes:
+        validators:
+            The values the response depends on.
+        last_modified:
+            When the data of the response last changed.
+            This attribute is optional.
+
+    Returns:
+        A 304 response when the client already have the response, or None,
+        and the headers to be sent with the response.
+    """
+
+    etag = hashlib.sha1(repr(validators).encode()).hexdigest()
+    headers = {"ETag": f'W/"{etag}"', "Cache-Control": "no-cache"}
+
+    if isinstance(last_modified, datetime):
+        last_modified = last_modified.astimezone(timezone.utc).replace(microsecond=0)
+        headers["Last-Modified"] = http_date(last_modified)
+    else:
+        last_modified = None
+
+    if request.if_none_match:
+        fresh = request.if_none_match.contains_weak(etag)
+    elif last_modified and request.if_modified_since:
+        fresh = last_modified <= request.if_modified_since
+    else:
+        fresh = False
+
+    if fresh:
+        return Response(status=304, headers=headers), headers
+    return None, headers
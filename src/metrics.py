@@ -0,0 +1,301 @@
+from __future__ import annotations
+from bisect import bisect_left
+from typing import Callable, List, Tuple
+import sys
+import threading
+import time
+from flask import Flask, Response, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+sys.path.insert(0, "./")
+from src.ORM.FDB_handler import FDBHandler, ModelMeta
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+
+class Metric:
+    """Base class of the metrics exported on the Prometheus text format
+
+    Attributes:
+        name:
+            The metric name.
+        help:
+            The description of the metric.
+        labels:
+            The names of the labels of the metric.
+    """
+
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labels = labels
+
+        self._values = {}  # label values: value
+        self._lock = threading.Lock()
+
+    def render(self) -> List[str]:
+        """Returns the lines of the metric on the Prometheus text format"""
+
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.extend(self._render_value(label_values, value))
+        return lines
+
+    def _render_value(self, label_values: tuple, value: float) -> List[str]:
+        return [f"{self.name}{self._format_labels(label_values)} {value}"]
+
+    def _format_labels(self, label_values: tuple, extra: dict = {}) -> str:
+        labels = {**dict(zip(self.labels, label_values)), **extra}
+        if not labels:
+            return ""
+
+        escaped = (
+            '{}="{}"'.format(
+                name,
+                str(value)
+                .replace("\\", "\\\\")
+                .replace('"', '\\"')
+                .replace("\n", "\\n"),
+            )
+            for name, value in labels.items()
+        )
+        return "{" + ",".join(escaped) + "}"
+
+
+class Counter(Metric):
+    """A value that only goes up"""
+
+    type = "counter"
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+
+class Gauge(Metric):
+    """A value read from a function when the metrics are rendered
+
+    Attributes:
+        collect:
+            Function returning a dict with the label values as key and the value.
+    """
+
+    type = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Tuple[str] = (),
+        collect: Callable[[], dict] = dict,
+    ) -> None:
+        super().__init__(name, help, labels)
+        self.collect = collect
+
+    def render(self) -> List[str]:
+        with self._lock:
+            self._values = self.collect()
+        return super().render()
+
+
+class Histogram(Metric):
+    """The distribution of the observed values on buckets
+
+    Attributes:
+        buckets:
+            The upper bounds of the buckets, in crescent order.
+    """
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Tuple[str] = (),
+        buckets: Tuple[float] = LATENCY_BUCKETS,
+    ) -> None:
+        super().__init__(name, help, labels)
+        self.buckets = buckets
+
+    def observe(self, *label_values: str, value: float) -> None:
+        with self._lock:
+            counts = self._values.get(label_values)
+            if counts is None:
+                # One count per bucket, plus the +Inf count and the sum
+                counts = self._values[label_values] = [0] * (len(self.buckets) + 2)
+
+            counts[bisect_left(self.buckets, value)] += 1
+            counts[-1] += value
+
+    def _render_value(self, label_values: tuple, counts: list) -> List[str]:
+        lines = []
+        total = 0
+
+        for bound, count in zip(self.buckets + ("+Inf",), counts):
+            total += count
+            labels = self._format_labels(label_values, {"le": bound})
+            lines.append(f"{self.name}_bucket{labels} {total}")
+
+        labels = self._format_labels(label_values)
+        lines.append(f"{self.name}_sum{labels} {counts[-1]}")
+        lines.append(f"{self.name}_count{labels} {total}")
+        return lines
+
+
+fdb_queries = Counter(
+    "fdb_queries_total",
+    "Firebird operations executed",
+    ("endpoint", "operation"),
+)
+fdb_rows = Counter(
+    "fdb_rows_total",
+    "Rows fetched from Firebird",
+    ("endpoint", "operation"),
+)
+fdb_latency = Histogram(
+    "fdb_query_duration_seconds",
+    "Latency of the Firebird operations",
+    ("endpoint", "operation"),
+)
+sqlite_latency = Histogram(
+    "sqlite_query_duration_seconds",
+    "Latency of the SQLAlchemy querys",
+    ("endpoint",),
+)
+http_requests = Counter(
+    "http_requests_total",
+    "Requests answered",
+    ("endpoint", "method", "status"),
+)
+http_latency = Histogram(
+    "http_request_duration_seconds",
+    "Latency of the requests",
+    ("endpoint", "method"),
+)
+http_queries = Histogram(
+    "http_request_queries",
+    "Database querys issued per request, Firebird and SQLAlchemy",
+    ("endpoint",),
+    buckets=QUERY_BUCKETS,
+)
+cache_counters = Gauge(
+    "model_cache",
+    "Counters of the model caches",
+    ("table", "counter"),
+    collect=lambda: {
+        (model.__tablename__, counter): value
+        for model in ModelMeta.cached_models
+        for counter, value in model.cache_stats().items()
+    },
+)
+pool_counters = Gauge(
+    "fdb_pool",
+    "Counters of the Firebird connection pools, by database",
+    ("database", "counter"),
+    collect=lambda: {
+        (database or "default", counter): value
+        for database, pool in FDBHandler().pools.items()
+        for counter, value in pool.stats().items()
+    },
+)
+
+METRICS = [
+    http_requests,
+    http_latency,
+    http_queries,
+    fdb_queries,
+    fdb_rows,
+    fdb_latency,
+    sqlite_latency,
+    cache_counters,
+    pool_counters,
+]
+
+
+def get_endpoint() -> str:
+    """The endpoint of the current request, or background outside requests"""
+
+    if has_request_context():
+        return request.endpoint or "not_found"
+    return "background"
+
+
+def count_query() -> None:
+    """Counts a query on the current request
+
+    The count is kept on the request environ, that is shared with
+    the copies of the request context used by the executor threads.
+    """
+
+    if has_request_context() and "metrics.queries" in request.environ:
+        request.environ["metrics.queries"] += 1
+
+
+def record_fdb_operation(operation: str, elapsed: float, rows: int) -> None:
+    endpoint = get_endpoint()
+
+    fdb_queries.inc(endpoint, operation)
+    fdb_rows.inc(endpoint, operation, amount=rows)
+    fdb_latency.observe(endpoint, operation, value=elapsed)
+
+    if operation != "commit":
+        count_query()
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["metrics_started"].pop()
+    sqlite_latency.observe(get_endpoint(), value=time.perf_counter() - started)
+    count_query()
+
+
+def render() -> str:
+    """Returns all the metrics on the Prometheus text format"""
+
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def init_metrics(app: Flask) -> None:
+    """Starts recording the metrics of the app and adds the /metrics endpoint
+
+    Records the requests, the Firebird operations made by FDBHandler
+    and the querys made by SQLAlchemy, per endpoint.
+    """
+
+    FDBHandler.listeners.append(record_fdb_operation)
+    event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", after_cursor_execute)
+
+    @app.before_request
+    def startRequestMetrics():
+        g.metrics_started = time.perf_counter()
+        request.environ["metrics.queries"] = 0
+
+    @app.after_request
+    def recordRequestMetrics(response):
+        if "metrics_started" in g:
+            endpoint = get_endpoint()
+            http_requests.inc(endpoint, request.method, str(response.status_code))
+            http_latency.observe(
+                endpoint,
+                request.method,
+                value=time.perf_counter() - g.metrics_started,
+            )
+            http_queries.observe(endpoint, value=request.environ["metrics.queries"])
+        return response
+
+    @app.route("/metrics")
+    def metrics():
+        return Response(render(), mimetype="text/plain; version=0.0.4")
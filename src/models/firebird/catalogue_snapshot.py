@@ -0,0 +1,186 @@
+from __future__ import annotations
+from datetime import datetime
+from itertools import islice
+import gzip
+import hashlib
+import os
+import sys
+import threading
+import time
+from decouple import config
+from flask import Flask
+
+from models.firebird.product import ProductModel
+from representations import dumps
+
+sys.path.insert(0, "./")
+from src.ORM.FDB_handler import FDBHandler
+
+
+class CatalogueSnapshot:
+    """Compressed snapshot of the whole catalogue of a company
+
+    A background thread writes the enriched products, with price and stock,
+    to a gzip NDJSON file every SNAPSHOT_INTERVAL seconds, defaults to 600.
+    With SNAPSHOT_INTERVAL=0 the thread is not started.
+    The clients download the file instead of paging through /products/.
+
+    One snapshot is kept per company, got by for_company, with the stock of the company.
+    The thread builds the snapshots of all the companies on EMPRESAS, one after the other.
+
+    Each build is written to a new file, named by the company and its version,
+    so a file being downloaded is never changed.
+    The files are kept on SNAPSHOT_DIR, defaults to snapshots.
+
+    Attributes:
+        company:
+            The company of the snapshot.
+        path:
+            The path of the current snapshot, or None before the first build.
+        etag:
+            The sha256 of the current snapshot file.
+        built_at:
+            When the current snapshot started to be built.
+        products:
+            The number of products on the current snapshot.
+    """
+
+    _snapshots = {}  # company: snapshot
+    _snapshots_lock = threading.Lock()
+    _thread = None
+
+    def __init__(self, company: str) -> None:
+        self.company = company
+        self.directory = os.path.abspath(config("SNAPSHOT_DIR", default="snapshots"))
+
+        self.path = None
+        self.etag = None
+        self.built_at = None
+        self.products = 0
+
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_company(cls, company: str = None) -> CatalogueSnapshot:
+        """Gets the snapshot of the company, defaults to the company of the current thread"""
+
+        company = company or FDBHandler().company
+
+        if company not in cls._snapshots:
+            with cls._snapshots_lock:
+                if company not in cls._snapshots:
+                    cls._snapshots[company] = cls(company)
+        return cls._snapshots[company]
+
+    @classmethod
+    def start(cls, app: Flask) -> None:
+        """Starts the background thread that builds the snapshots"""
+
+        interval = config("SNAPSHOT_INTERVAL", default=600, cast=float)
+        if interval <= 0:
+            return
+
+        with cls._snapshots_lock:
+            if cls._thread is None:
+                cls._thread = threading.Thread(
+                    target=cls._run, args=(app, interval), daemon=True
+                )
+                cls._thread.start()
+
+    def current(self) -> tuple:
+        """Gets the path, etag and built_at of the current snapshot"""
+
+        with self._lock:
+            return self.path, self.etag, self.built_at
+
+    def build(self) -> None:
+        """Writes a new snapshot and makes it the current one
+
+        When nothing changed since the current snapshot it's kept, with its version.
+        Must run inside an app context, for the SQLite querys,
+        on a thread using the company of the snapshot.
+        """
+
+        built_at = datetime.now()
+        version = built_at.strftime("%Y%m%d%H%M%S%f")
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(
+            self.directory, f"catalogue-{self.company}-{version}.ndjson.gz"
+        )
+        temp_path = path + ".tmp"
+
+        products = 0
+        digest = hashlib.sha256()
+
+        try:
+            with open(temp_path, "wb") as file:
+                with gzip.GzipFile(fileobj=file, mode="wb", mtime=0) as compressed:
+                    objects = ProductModel.iter_objects()
+
+                    while True:
+                        batch = list(islice(objects, 500))
+                        if not batch:
+                            break
+
+                        for product in ProductModel.json_many(batch):
+                            compressed.write(dumps(product) + b"\n")
+                        products += len(batch)
+
+            with open(temp_path, "rb") as file:
+                for chunk in iter(lambda: file.read(1 << 16), b""):
+                    digest.update(chunk)
+
+            if digest.hexdigest() == self.etag:
+                return
+
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        with self._lock:
+            self.path = path
+            self.etag = digest.hexdigest()
+            self.built_at = built_at
+            self.products = products
+
+        self._remove_old_files()
+
+    def _remove_old_files(self) -> None:
+        """Removes the snapshots of the company before the current one
+
+        The files still open, being downloaded on Windows, are removed on the next build.
+        """
+
+        prefix = f"catalogue-{self.company}-"
+
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.startswith(prefix) and path != self.path:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    @classmethod
+    def _run(cls, app: Flask, interval: float) -> None:
+        handler = FDBHandler()
+
+        while True:
+            started = time.monotonic()
+
+            for company in handler.companies:
+                handler.use_company(company)
+
+                try:
+                    with app.app_context():
+                        cls.for_company(company).build()
+                except Exception as e:
+                    app.logger.exception(
+                        f"Erro ao gerar o snapshot do catálogo da empresa {company}: {e}"
+                    )
+                finally:
+                    handler.release()
+
+            time.sleep(max(interval - (time.monotonic() - started), 0))
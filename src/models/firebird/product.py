@@ -1,26 +1,69 @@
 from __future__ import annotations
+from collections import defaultdict
 from datetime import datetime
+from decimal import Decimal
 import sys
-from typing import Union
+import time
+from functools import partial
+from typing import Callable, Dict, List, Tuple, Union
 from decouple import config
+from flask import copy_current_request_context, current_app, has_request_context
 
 from models.sqlite.update import UpdateModel
+from models.sqlite.product_change import ProductChangeModel
 
 sys.path.insert(0, "./")
-from src.ORM.FDB_handler import FDBModel, Column
+from src.ORM.FDB_handler import FDBHandler, FDBModel, Column, convert_decimal
+
+
+def record_change(obj: FDBModel) -> None:
+    """Records the product of the object as changed when the transaction is commited
+
+    The products changed on the same transaction are saved together on the ProductChangeModel.
+    They are kept on the transaction, so they are discarded when it's rolled back.
+    """
+
+    handler = FDBHandler()
+    pending = handler.after_commit(PendingChanges(handler.database))
+    pending.codes.add(obj.CODPROD)
+
+
+class PendingChanges:
+    """The products changed on the current transaction of the database
+
+    Registered once per transaction with FDBHandler.after_commit,
+    the instances of the same database are equal.
+    """
+
+    def __init__(self, database: str) -> None:
+        self.database = database
+        self.codes = set()
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, PendingChanges) and other.database == self.database
+
+    __hash__ = None
+
+    def __call__(self) -> None:
+        ProductChangeModel.record(self.database, self.codes)
 
 
 class ProductModel(FDBModel):
     __tablename__ = "PRODUTO"
+    __cache_size__ = config("CACHE_SIZE", default=1024, cast=int)
+    __cache_ttl__ = config("CACHE_TTL", default=30, cast=float)
+
+    CODPROD = Column(is_primary_key=True, data_type=str)
+    CODIGO = Column(data_type=str)
+    NOMEPROD = Column(data_type=str)
+    UNIDADE = Column(data_type=str)
+    DESCMAXIMO = Column(data_type=Decimal)
+    FLAGINATIVO = Column(data_type=bool)
+    FLAGNAOVENDER = Column(data_type=bool)
+    FLAGCONTROLAESTOQUE = Column(data_type=bool)
 
-    CODPROD = Column(is_primary_key=True)
-    CODIGO = Column()
-    NOMEPROD = Column()
-    UNIDADE = Column()
-    DESCMAXIMO = Column()
-    FLAGINATIVO = Column()
-    FLAGNAOVENDER = Column()
-    FLAGCONTROLAESTOQUE = Column()
+    relations = {"ESTOQUE": 0, "PRECO": 1, "PRECOS": 1, "last_stock_update": 2}
+    sqlite_loaders = {2}
 
     def __init__(
         self,
@@ -43,51 +86,297 @@ class ProductModel(FDBModel):
         self.FLAGNAOVENDER = self.process_boolean(FLAGNAOVENDER)
         self.FLAGCONTROLAESTOQUE = self.process_boolean(FLAGCONTROLAESTOQUE)
 
-    def json(self) -> str:
-        stock = self.get_stock()
-        price = self.get_price()
+    def json(
+        self,
+        concurrent: bool = False,
+        fields: List[str] = None,
+        CODPRECO: str = "000000001",
+    ) -> str:
+        return self._build_json(
+            *self.get_relations(concurrent, fields), fields, CODPRECO
+        )
+
+    def get_relations(
+        self, concurrent: bool = False, fields: List[str] = None
+    ) -> tuple:
+        """Gets the stock, prices and last stock update of the product
+
+        Only the relations on fields are fetched, the others are None.
+        """
+
+        return self._fetch_relations(
+            [
+                self.get_stock,
+                self.get_prices,
+                partial(self.get_last_stock_update, FDBHandler().company),
+            ],
+            fields,
+            concurrent,
+        )
+
+    @classmethod
+    def parse_fields(cls, fields: str) -> Tuple[List[str], Tuple[str]]:
+        """Reads the comma separated fields to be returned on the JSON
 
-        last_stock_update = UpdateModel.get_last_for_code(self.CODPROD)
+        The fields can be any of the columns and of the relations,
+        ESTOQUE, PRECO, PRECOS and last_stock_update.
+
+        Returns:
+            The fields, or None to return all of them,
+            and the columns to be selected, or None to select all of them.
+
+        Raises:
+            ValueError: When any of the fields don't exist.
+        """
+
+        if not fields:
+            return None, None
+
+        fields = list(dict.fromkeys(field.strip() for field in fields.split(",")))
+        for field in fields:
+            if field not in cls._columns and field not in cls.relations:
+                raise ValueError(field)
+
+        return fields, cls._check_columns(
+            [field for field in fields if field in cls._columns] or cls._primary_key
+        )
 
-        return self.convert_to_JSON(
+    @classmethod
+    def catalogue_version(cls, CODEMPRESA: str) -> tuple:
+        """Gets the values that change when the products of the company change.
+
+        They are the last stock change, the last product changed by the server
+        and the last stock update, fetched by indexes without reading the products.
+        The changes made by other programs on PRODUTO and PRODUTOPRECO are not seen,
+        so the version also changes every CACHE_TTL seconds, the time the lookups stay cached,
+        and the last change time is at least the start of the current CACHE_TTL period.
+
+        Returns:
+            The version, with the last change time as the first value.
+        """
+
+        return cls._version(
+            CODEMPRESA,
+            ProductStock.last_change(CODEMPRESA),
+            ProductChangeModel.last_changed_at(FDBHandler().database_of(CODEMPRESA)),
+            UpdateModel.last_created_at(CODEMPRESA),
+        )
+
+    def get_version(self, stock: ProductStock, last_stock_update: dict) -> tuple:
+        """Gets the values that change when the product, its stock or prices change.
+
+        Like catalogue_version, from the stock and last stock update already loaded
+        and the last change of the product by the server, without loading the prices.
+        The stock and last stock update are None when they were not loaded.
+
+        Returns:
+            The version, with the last change time as the first value.
+        """
+
+        return self._version(
+            repr(self),
+            repr(stock),
+            last_stock_update and last_stock_update["id"],
+            stock.LAST_CHANGE if stock else None,
+            ProductChangeModel.last_changed_at(FDBHandler().database, self.CODPROD),
+        )
+
+    @classmethod
+    def _version(cls, *values) -> tuple:
+        ttl = max(cls.__cache_ttl__, 1)
+        period = int(time.time() // ttl)
+
+        last_change = max(
+            [value for value in values if isinstance(value, datetime)]
+            + [datetime.fromtimestamp(period * ttl)]
+        )
+        return (last_change, *values, period)
+
+    @classmethod
+    def json_many(
+        cls,
+        products: List[ProductModel],
+        concurrent: bool = False,
+        fields: List[str] = None,
+        CODPRECO: str = "000000001",
+    ) -> List[dict]:
+        """Serializes a list of products loading its relations in batch.
+
+        The stock, prices and last stock update of all the products are loaded
+        with a constant number of querys, instead of the querys per product
+        made by json().
+        Only the relations on fields are loaded.
+        """
+
+        codes = [product.CODPROD for product in products]
+        if not codes:
+            return []
+
+        stocks, prices, last_updates = [
+            loaded or {}
+            for loaded in cls._fetch_relations(
+                [
+                    partial(cls._load_stocks, codes),
+                    partial(cls._load_prices, codes),
+                    partial(cls._load_last_stock_updates, FDBHandler().company, codes),
+                ],
+                fields,
+                concurrent,
+            )
+        ]
+
+        return [
+            product._build_json(
+                stocks.get(product.CODPROD),
+                prices.get(product.CODPROD),
+                last_updates.get(product.CODPROD),
+                fields,
+                CODPRECO,
+            )
+            for product in products
+        ]
+
+    @classmethod
+    def _fetch_relations(
+        cls, loaders: List[Callable], fields: List[str], concurrent: bool
+    ) -> list:
+        """Runs the loaders of the relations requested on fields
+
+        The loaders are the stock, prices and last stock update loaders,
+        the relations PRECO and PRECOS share the prices loader.
+
+        Returns:
+            The loaded relations, with None for the ones not requested.
+        """
+
+        requested = sorted(
             {
-                "CODPROD": self.CODPROD,
-                "CODIGO": self.CODIGO,
-                "NOMEPROD": self.NOMEPROD,
-                "UNIDADE": self.UNIDADE,
-                "DESCMAXIMO": self.DESCMAXIMO,
-                "FLAGINATIVO": self.FLAGINATIVO,
-                "FLAGNAOVENDER": self.FLAGNAOVENDER,
-                "FLAGCONTROLAESTOQUE": self.FLAGCONTROLAESTOQUE,
-                "PRECO": price.PRECO if price else None,
-                "ESTOQUE": stock.json() if stock else None,
-                "last_stock_update": last_stock_update.as_dict()
-                if last_stock_update
-                else None,
+                idx
+                for relation, idx in cls.relations.items()
+                if fields is None or relation in fields
             }
         )
+        if not requested:
+            return [None] * len(loaders)
+
+        loaded = cls._fetch(
+            {idx: loaders[idx] for idx in requested}, concurrent=concurrent
+        )
+        return [loaded.get(idx) for idx in range(len(loaders))]
+
+    @classmethod
+    def _fetch(cls, loaders: Dict[int, Callable], concurrent: bool = False) -> dict:
+        """Runs the loaders of the product relations.
+
+        With concurrent the SQLite loaders run on the FDBHandler executor,
+        inside a copy of the request context, or their own app context outside requests,
+        while the Firebird loaders run on the current thread, with its connection.
+        The executor never checks out Firebird connections,
+        so the requests don't wait on each other for the pool.
+
+        Returns:
+            The results, by the index of the loaders.
+        """
+
+        background = [idx for idx in loaders if idx in cls.sqlite_loaders]
+        if not concurrent or not background:
+            return {idx: loader() for idx, loader in loaders.items()}
+
+        if has_request_context():
+            in_app_context = copy_current_request_context
+        else:
+            app = current_app._get_current_object()
+
+            def in_app_context(loader):
+                def run():
+                    with app.app_context():
+                        return loader()
+
+                return run
+
+        handler = FDBHandler()
+        futures = {
+            idx: handler.run_in_background(in_app_context(loaders[idx]))
+            for idx in background
+        }
+
+        results = {
+            idx: loader() for idx, loader in loaders.items() if idx not in futures
+        }
+        results.update((idx, future.result()) for idx, future in futures.items())
+        return results
+
+    @staticmethod
+    def _load_stocks(codes: List[str]) -> dict:
+        stocks = {}
+        for stock in ProductStock.find_by_values(
+            "CODPROD", codes, CODEMPRESA=FDBHandler().company
+        ):
+            stocks.setdefault(stock.CODPROD, stock)
+        return stocks
+
+    @staticmethod
+    def _load_prices(codes: List[str]) -> dict:
+        return ProductPrice.load_matrix(codes)
+
+    @staticmethod
+    def _load_last_stock_updates(CODEMPRESA: str, codes: List[str]) -> dict:
+        last_updates = UpdateModel.get_last_for_codes(CODEMPRESA, codes)
+
+        return {code: update.as_dict() for code, update in last_updates.items()}
+
+    def _build_json(
+        self,
+        stock: ProductStock,
+        prices: Dict[str, Decimal],
+        last_stock_update: dict,
+        fields: List[str] = None,
+        CODPRECO: str = "000000001",
+    ) -> str:
+        prices = prices or {}
+
+        data = self.serialize()
+        data["PRECO"] = convert_decimal(prices.get(CODPRECO))
+        data["PRECOS"] = {
+            codpreco: convert_decimal(preco) for codpreco, preco in prices.items()
+        }
+        data["ESTOQUE"] = stock.serialize() if stock else None
+        data["last_stock_update"] = last_stock_update
+
+        if fields is not None:
+            return {field: data[field] for field in fields}
+        return data
 
     def get_stock(self) -> ProductStock:
         product_stock = ProductStock.find_by_columns(
-            CODPROD=self.CODPROD, CODEMPRESA=config("CODEMPRESA")
+            CODPROD=self.CODPROD, CODEMPRESA=FDBHandler().company
         )
         if product_stock:
             return product_stock[0]
         return None
 
-    def get_price(self) -> ProductPrice:
-        product_price = ProductPrice.find_by_columns(
-            CODPROD=self.CODPROD, CODPRECO="000000001"
+    def get_last_stock_update(self, CODEMPRESA: str = None) -> dict:
+        last_stock_update = UpdateModel.get_last_for_code(
+            CODEMPRESA or FDBHandler().company, self.CODPROD
         )
-        if product_price:
-            return product_price[0]
+        if last_stock_update:
+            return last_stock_update.as_dict()
         return None
 
-    def update(self) -> None:
+    def get_prices(self) -> Dict[str, Decimal]:
+        return ProductPrice.load_matrix([self.CODPROD]).get(self.CODPROD, {})
+
+    def get_price(self, CODPRECO: str = "000000001") -> Decimal:
+        return self.get_prices().get(CODPRECO)
+
+    def _on_update(self) -> None:
         self.FLAGCONTROLAESTOQUE = self.process_boolean(self.FLAGCONTROLAESTOQUE)
         self.FLAGINATIVO = self.process_boolean(self.FLAGINATIVO)
         self.FLAGNAOVENDER = self.process_boolean(self.FLAGNAOVENDER)
-        return super().update()
+        record_change(self)
+
+    def _on_insert(self) -> None:
+        record_change(self)
 
     @staticmethod
     def process_boolean(tag):
@@ -99,12 +388,14 @@ class ProductModel(FDBModel):
 
 class ProductStock(FDBModel):
     __tablename__ = "PRODUTOESTOQUE"
+    __cache_size__ = config("CACHE_SIZE", default=1024, cast=int)
+    __cache_ttl__ = config("CACHE_TTL", default=30, cast=float)
 
-    CODPROD = Column(is_primary_key=True)
-    CODEMPRESA = Column(is_primary_key=True)
-    CODSETORESTOQUE = Column()
-    ESTATU = Column()
-    LAST_CHANGE = Column()
+    CODPROD = Column(is_primary_key=True, data_type=str)
+    CODEMPRESA = Column(is_primary_key=True, data_type=int)
+    CODSETORESTOQUE = Column(data_type=str)
+    ESTATU = Column(data_type=Decimal)
+    LAST_CHANGE = Column(data_type=datetime)
 
     def __init__(
         self, CODPROD, CODEMPRESA, CODSETORESTOQUE, ESTATU, LAST_CHANGE
@@ -116,31 +407,139 @@ class ProductStock(FDBModel):
         self.LAST_CHANGE = LAST_CHANGE
 
     def json(self) -> str:
-        return self.convert_to_JSON(
-            {
-                "CODEMPRESA": self.CODEMPRESA,
-                "CODPROD": self.CODPROD,
-                "CODSETORESTOQUE": self.CODSETORESTOQUE,
-                "ESTATU": self.ESTATU,
-                "LAST_CHANGE": self.LAST_CHANGE,
-            }
-        )
+        return self.serialize()
 
-    def update(self) -> None:
+    def _on_update(self) -> None:
         self.LAST_CHANGE = datetime.now()
-        return super().update()
+
+    @classmethod
+    def adjust_query(cls, returning: bool = False) -> str:
+        """Gets the query that adds an amount to the stock on the database.
+
+        The sum is done by the database, so concurrent adjustments are not lost.
+        Its parameters are the amount, the LAST_CHANGE, the CODPROD and the CODEMPRESA.
+
+        Attributes:
+            returning:
+                If true the query returns the columns of the stock after the adjustment.
+        """
+
+        query = f"""
+        UPDATE
+            {cls.__tablename__}
+        SET
+            ESTATU = ESTATU + ?, LAST_CHANGE = ?
+        WHERE
+            CODPROD = ? AND CODEMPRESA = ?
+        """
+
+        if returning:
+            query += "RETURNING " + ", ".join(cls._columns)
+        return query
+
+    @classmethod
+    def last_change(cls, CODEMPRESA: str) -> datetime:
+        """Gets the last LAST_CHANGE of the company stock."""
+
+        query = f"SELECT MAX(LAST_CHANGE) FROM {cls.__tablename__} WHERE CODEMPRESA = ?"
+        return FDBHandler().fetchone(query, [CODEMPRESA])[0]
+
+    @classmethod
+    def changed_since(cls, CODEMPRESA: str, since: datetime) -> List[str]:
+        """Gets the codes of the products which stock changed after since.
+
+        Uses the LAST_CHANGE column, that should be indexed on the database.
+        """
+
+        query = f"""
+        SELECT
+            CODPROD
+        FROM
+            {cls.__tablename__}
+        WHERE
+            LAST_CHANGE > ? AND CODEMPRESA = ?
+        """
+
+        return [row[0] for row in FDBHandler().fetchall(query, [since, CODEMPRESA])]
+
+    @classmethod
+    def fetch_valuation(cls, CODEMPRESA: str, CODPRECO: str) -> dict:
+        """Fetch the stock of the company with the price, organized per column.
+
+        ESTATU and PRECO are float arrays, with NaN for the products without price.
+        """
+
+        query = f"""
+        SELECT
+            E.CODPROD, E.CODSETORESTOQUE, E.ESTATU, P.PRECO
+        FROM
+            {cls.__tablename__} E
+        LEFT JOIN
+            {ProductPrice.__tablename__} P
+            ON P.CODPROD = E.CODPROD AND P.CODPRECO = ?
+        WHERE
+            E.CODEMPRESA = ?
+        """
+
+        return FDBHandler().fetchall_as_columns(
+            query, [CODPRECO, CODEMPRESA], typecodes={"ESTATU": "d", "PRECO": "d"}
+        )
 
 
 class ProductPrice(FDBModel):
     __tablename__ = "PRODUTOPRECO"
+    __cache_size__ = config("CACHE_SIZE", default=1024, cast=int)
+    __cache_ttl__ = config("CACHE_TTL", default=30, cast=float)
 
-    CODPRODUTOPRECO = Column(is_primary_key=True)
-    CODPROD = Column()
-    CODPRECO = Column()
-    PRECO = Column()
+    CODPRODUTOPRECO = Column(is_primary_key=True, data_type=str)
+    CODPROD = Column(data_type=str)
+    CODPRECO = Column(data_type=str)
+    PRECO = Column(data_type=Decimal)
 
     def __init__(self, CODPRODUTOPRECO, CODPROD, CODPRECO, PRECO) -> None:
         self.CODPRODUTOPRECO = CODPRODUTOPRECO
         self.CODPROD = CODPROD
         self.CODPRECO = CODPRECO
         self.PRECO = PRECO
+
+    @classmethod
+    def load_matrix(cls, codes: List[str]) -> Dict[str, Dict[str, Decimal]]:
+        """Loads the prices of all the tiers of the products.
+
+        The products not cached are loaded together, with one query per
+        chunk of codes, instead of one query per product and tier.
+        The prices of each product are cached as find_by_columns(CODPROD=...),
+        so they are invalidated when any of them is updated or inserted.
+
+        Returns:
+            The price matrix, as CODPROD: {CODPRECO: PRECO}.
+        """
+
+        matrix = {}
+        missing = []
+
+        for code in dict.fromkeys(codes):
+            cached = cls._cache_get((("CODPROD", str(code)),))
+            if cached is not None:
+                matrix[code] = cached
+            else:
+                missing.append(code)
+
+        if missing:
+            found = defaultdict(list)
+            for price in cls.find_by_values("CODPROD", missing):
+                found[price.CODPROD].append(price)
+
+            for code in missing:
+                matrix[code] = cls._cache_set((("CODPROD", str(code)),), found[code])
+
+        return {
+            code: {price.CODPRECO: price.PRECO for price in prices}
+            for code, prices in matrix.items()
+        }
+
+    def _on_update(self) -> None:
+        record_change(self)
+
+    def _on_insert(self) -> None:
+        record_change(self)
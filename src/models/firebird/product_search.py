@@ -0,0 +1,339 @@
+from __future__ import annotations
+from collections import defaultdict
+import sys
+import threading
+import time
+import unicodedata
+from typing import List
+from decouple import config
+from flask import Flask, current_app, has_app_context
+
+from models.firebird.product import ProductModel
+from models.sqlite.product_change import ProductChangeModel
+
+sys.path.insert(0, "./")
+from src.ORM.FDB_handler import FDBHandler
+
+
+class ProductSearchIndex:
+    """In memory search index for the products
+
+    Keeps the words of NOMEPROD and the CODIGO of every product in memory,
+    so the product search don't need to scan the PRODUTO table.
+    The words are indexed by trigram to answer partial words.
+
+    The index is loaded on the first search, or on background by warm,
+    and refreshed on background after SEARCH_INDEX_REFRESH seconds, defaults to 300.
+    The refresh only changes the products that changed on the database.
+
+    The refresh also finds the products changed by other programs, like the C-Plus,
+    comparing the hashes of their PRODUTO and PRODUTOPRECO rows with the last refresh,
+    and records them on the ProductChangeModel, for /products/changes.
+    The changes made before the first load, while the server was stopped, are not found.
+
+    One index is kept per database, got by for_company,
+    the companies on the same database share it.
+
+    Attributes:
+        company:
+            The company used to query the database of the index.
+    """
+
+    _indexes = {}  # database: index
+    _indexes_lock = threading.Lock()
+
+    def __init__(self, company: str = None) -> None:
+        self.company = company
+        self.refresh_interval = config("SEARCH_INDEX_REFRESH", default=300, cast=float)
+        self.version = 0
+
+        self._lock = threading.RLock()
+        self._refreshing = False
+        self._loaded_at = None
+
+        self._products = {}  # CODPROD: (CODIGO, NOMEPROD, words)
+        self._words = defaultdict(set)  # word: CODPRODs
+        self._trigrams = defaultdict(set)  # trigram: words
+        self._codes = defaultdict(set)  # CODIGO: CODPRODs
+        self._hashes = {}  # CODPROD: hash of the product and prices rows
+
+    @classmethod
+    def for_company(cls, company: str = None) -> ProductSearchIndex:
+        """Gets the index of the company database, creating it on the first use
+
+        Defaults to the company of the current thread.
+        """
+
+        handler = FDBHandler()
+        company = company or handler.company
+        database = handler.database_of(company)
+
+        if database not in cls._indexes:
+            with cls._indexes_lock:
+                if database not in cls._indexes:
+                    cls._indexes[database] = cls(company)
+        return cls._indexes[database]
+
+    def search(self, text: str) -> List[str]:
+        """Searchs the products by name or code.
+
+        Every word of the text must be found on the product name,
+        as a whole word or part of it. Products with the text as code are also returned.
+
+        Attributes:
+            text:
+                The text to be searched.
+
+        Returns:
+            The list of CODPROD ordered by relevance.
+        """
+
+        self.ensure_fresh()
+
+        text = self.normalize(text)
+        words = text.split()
+        if not words:
+            return []
+
+        with self._lock:
+            scores = self._score_words(words)
+
+            for codprod in self._codes.get(self.normalize_code(text), ()):
+                scores[codprod] = scores.get(codprod, 0) + 10
+
+            return sorted(
+                scores,
+                key=lambda codprod: (-scores[codprod], self._products[codprod][1]),
+            )
+
+    def find_by_code(self, codigo: str) -> List[str]:
+        """Finds the products with exactly the code, on the CODIGO hash map.
+
+        Attributes:
+            codigo:
+                The code to be found, like the barcode.
+
+        Returns:
+            The list of CODPROD, empty when the code isn't on the index.
+        """
+
+        self.ensure_fresh()
+
+        with self._lock:
+            return sorted(self._codes.get(self.normalize_code(codigo), ()))
+
+    def warm(self) -> None:
+        """Starts loading the index on background, so the first requests don't load it"""
+
+        threading.Thread(target=self._background_load, daemon=True).start()
+
+    def ensure_fresh(self) -> None:
+        """Loads the index if empty, or starts a refresh if it's outdated"""
+
+        if self._loaded_at is None:
+            with self._lock:
+                if self._loaded_at is None:
+                    self.refresh()
+        elif time.monotonic() - self._loaded_at > self.refresh_interval:
+            with self._lock:
+                if self._refreshing:
+                    return
+                self._refreshing = True
+
+            app = current_app._get_current_object() if has_app_context() else None
+            threading.Thread(
+                target=self._background_refresh, args=(app,), daemon=True
+            ).start()
+
+    def refresh(self) -> None:
+        """Updates the index with the products on the database
+
+        After the first load, the products with changed rows are recorded
+        on the ProductChangeModel, so it must run inside an app context.
+        """
+
+        handler = FDBHandler()
+        prices = self._hash_prices()
+        rows = handler.iter_rows(
+            f"SELECT {', '.join(ProductModel._columns)} FROM PRODUTO", as_dict=False
+        )
+        codprod_idx = ProductModel._columns.index("CODPROD")
+        codigo_idx = ProductModel._columns.index("CODIGO")
+        nomeprod_idx = ProductModel._columns.index("NOMEPROD")
+
+        changed = []
+        with self._lock:
+            removed = set(self._products)
+        for row in rows:
+            codprod = row[codprod_idx]
+            removed.discard(codprod)
+            self.put(codprod, row[codigo_idx], row[nomeprod_idx])
+
+            row_hash = hash((tuple(row), prices.get(codprod)))
+            if self._hashes.get(codprod) != row_hash:
+                self._hashes[codprod] = row_hash
+                changed.append(codprod)
+
+        for codprod in removed:
+            self.remove(codprod)
+            self._hashes.pop(codprod, None)
+            changed.append(codprod)
+
+        if self._loaded_at is not None and changed:
+            ProductChangeModel.record(handler.database, changed)
+
+        self._loaded_at = time.monotonic()
+
+    @staticmethod
+    def _hash_prices() -> dict:
+        """Hashes the prices of every product, by CODPROD"""
+
+        prices = defaultdict(list)
+        for CODPROD, CODPRECO, PRECO in FDBHandler().iter_rows(
+            "SELECT CODPROD, CODPRECO, PRECO FROM PRODUTOPRECO", as_dict=False
+        ):
+            prices[CODPROD].append((CODPRECO, PRECO))
+
+        return {
+            CODPROD: hash(tuple(sorted(rows, key=repr)))
+            for CODPROD, rows in prices.items()
+        }
+
+    def put(self, codprod: str, codigo: str, nomeprod: str) -> None:
+        """Adds or updates a product on the index"""
+
+        with self._lock:
+            current = self._products.get(codprod)
+            if current and current[:2] == (codigo, nomeprod):
+                return
+
+            if current:
+                self.remove(codprod)
+
+            words = set(self.normalize(nomeprod).split())
+            self._products[codprod] = (codigo, nomeprod or "", words)
+
+            for word in words:
+                if word not in self._words:
+                    for trigram in self._get_trigrams(word):
+                        self._trigrams[trigram].add(word)
+                self._words[word].add(codprod)
+
+            code = self.normalize_code(codigo)
+            if code:
+                self._codes[code].add(codprod)
+
+            self.version += 1
+
+    def remove(self, codprod: str) -> None:
+        """Removes a product from the index"""
+
+        with self._lock:
+            current = self._products.pop(codprod, None)
+            if not current:
+                return
+
+            codigo, _, words = current
+
+            for word in words:
+                self._words[word].discard(codprod)
+                if not self._words[word]:
+                    del self._words[word]
+                    for trigram in self._get_trigrams(word):
+                        self._trigrams[trigram].discard(word)
+                        if not self._trigrams[trigram]:
+                            del self._trigrams[trigram]
+
+            code = self.normalize_code(codigo)
+            if code:
+                codes = self._codes[code]
+                codes.discard(codprod)
+                if not codes:
+                    del self._codes[code]
+
+            self.version += 1
+
+    def _score_words(self, words: List[str]) -> dict:
+        """Scores the products that have all the words on the name.
+
+        Each word scores 3 when it's a whole word on the name,
+        2 when it's the start of a word and 1 when it's inside a word.
+        """
+
+        scores = None
+
+        for word in words:
+            word_scores = {}
+            for found in self._find_words(word):
+                score = 3 if found == word else 2 if found.startswith(word) else 1
+                for codprod in self._words[found]:
+                    word_scores[codprod] = max(word_scores.get(codprod, 0), score)
+
+            if scores is None:
+                scores = word_scores
+            else:
+                scores = {
+                    codprod: score + word_scores[codprod]
+                    for codprod, score in scores.items()
+                    if codprod in word_scores
+                }
+
+            if not scores:
+                break
+
+        return scores
+
+    def _find_words(self, word: str) -> set:
+        """Finds the indexed words that contains the word"""
+
+        trigrams = self._get_trigrams(word)
+
+        if len(word) < 3:
+            candidates = self._words.keys()
+        else:
+            candidates = set.intersection(
+                *[self._trigrams.get(trigram, set()) for trigram in trigrams]
+            )
+
+        return {candidate for candidate in candidates if word in candidate}
+
+    @staticmethod
+    def _get_trigrams(word: str) -> set:
+        return {word[idx : idx + 3] for idx in range(len(word) - 2)}
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Removes the accents and uppercases the text"""
+
+        text = unicodedata.normalize("NFKD", text or "")
+        return "".join(char for char in text if not unicodedata.combining(char)).upper()
+
+    @classmethod
+    def normalize_code(cls, code: str) -> str:
+        """Normalizes the code, like the CODIGO, without the surrounding spaces
+
+        Used on every read and write of the codes map.
+        """
+
+        return cls.normalize(code).strip()
+
+    def _background_load(self) -> None:
+        FDBHandler().use_company(self.company)
+
+        try:
+            self.ensure_fresh()
+        finally:
+            FDBHandler().release()
+
+    def _background_refresh(self, app: Flask = None) -> None:
+        FDBHandler().use_company(self.company)
+
+        try:
+            if app is None:
+                self.refresh()
+            else:
+                with app.app_context():
+                    self.refresh()
+        finally:
+            FDBHandler().release()
+            self._refreshing = False
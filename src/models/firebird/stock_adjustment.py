@@ -0,0 +1,160 @@
+from __future__ import annotations
+from concurrent.futures import Future, wait
+from datetime import datetime
+import sys
+import threading
+import time
+from typing import Dict, List
+
+from models.firebird.product import ProductStock
+
+sys.path.insert(0, "./")
+from src.ORM.FDB_handler import FDBHandler, Singleton
+
+
+class StockAdjustmentQueue(metaclass=Singleton):
+    """Serializes and coalesces the stock adjustments per product
+
+    The adjustments of a product are queued, and the first caller flushes the queue
+    while the others wait for it.
+    Each flush sums the pending amounts on a single atomic increment, ESTATU = ESTATU + ?,
+    and one commit on its own connection, so concurrent adjustments of the same product
+    are never lost and cost one round trip together.
+    The products of a bulk adjustment are flushed together, on one transaction.
+    """
+
+    def __init__(self) -> None:
+        self._pending = {}  # (CODPROD, CODEMPRESA): [(amount, future)]
+        self._lock = threading.Lock()
+
+    def adjust(self, CODPROD: str, CODEMPRESA: str, amount: float) -> ProductStock:
+        """Adds the amount to the stock of the product and commits it.
+
+        Attributes:
+            CODPROD:
+                The product code.
+            CODEMPRESA:
+                The company of the stock.
+            amount:
+                The amount added to the stock, negative to remove.
+
+        Returns:
+            The stock after the flush with the adjustment, or None when not found.
+
+        Raises:
+            Any database error of the flush.
+        """
+
+        return self.adjust_many(CODEMPRESA, {CODPROD: amount})[CODPROD].result()
+
+    def adjust_many(self, CODEMPRESA: str, amounts: Dict[str, float]) -> dict:
+        """Adds the amounts to the stocks of the products and commits them.
+
+        The products not being flushed by other callers are flushed together,
+        on one transaction.
+        Each product has its own outcome, as the flush of a product can be done
+        by another caller, with other products, and fail without the others.
+
+        Attributes:
+            CODEMPRESA:
+                The company of the stocks.
+            amounts:
+                The amount added to the stock of each product, by CODPROD.
+
+        Returns:
+            The done futures of the stocks after the flushes, by CODPROD.
+            Their result is None for the products not found,
+            and their exception the database error of the flush.
+        """
+
+        futures = {}
+        flushing = []
+
+        with self._lock:
+            for CODPROD, amount in amounts.items():
+                key = (CODPROD, CODEMPRESA)
+                futures[CODPROD] = Future()
+
+                if key not in self._pending:
+                    flushing.append(key)
+                self._pending.setdefault(key, []).append((amount, futures[CODPROD]))
+
+        if flushing:
+            self._flush(CODEMPRESA, flushing)
+
+        wait(futures.values())
+        return futures
+
+    def _flush(self, CODEMPRESA: str, keys: List[tuple]) -> None:
+        """Applies the pending adjustments of the products until their queues are empty
+
+        The stock rows are only locked by the transaction of their flusher,
+        that commits before leaving the queue, so the flushes never wait on each other.
+        """
+
+        while keys:
+            with self._lock:
+                batches = {}
+                for key in keys:
+                    if self._pending[key]:
+                        batches[key] = self._pending[key]
+                        self._pending[key] = []
+                    else:
+                        del self._pending[key]
+                keys = list(batches)
+
+            if not batches:
+                return
+
+            try:
+                stocks = self._apply(
+                    CODEMPRESA,
+                    {
+                        key[0]: sum(amount for amount, _ in batch)
+                        for key, batch in batches.items()
+                    },
+                )
+            except Exception as e:
+                for batch in batches.values():
+                    for _, future in batch:
+                        future.set_exception(e)
+            else:
+                for key, batch in batches.items():
+                    for _, future in batch:
+                        future.set_result(stocks.get(key[0]))
+
+    @staticmethod
+    def _apply(CODEMPRESA: str, amounts: Dict[str, float]) -> Dict[str, ProductStock]:
+        """Adds the amounts to the stocks on one transaction of its own connection
+
+        The querys and the commit are notified to the FDBHandler listeners,
+        like the ones on the connection of the thread.
+        """
+
+        handler = FDBHandler()
+        now = datetime.now()
+        rows = []
+
+        with handler.pool_for(CODEMPRESA).connection() as con:
+            cur = con.cursor()
+            for CODPROD, amount in amounts.items():
+                started = time.perf_counter()
+                cur.execute(
+                    ProductStock.adjust_query(returning=True),
+                    [amount, now, CODPROD, CODEMPRESA],
+                )
+                row = cur.fetchone()
+                handler._notify("fetchone", started, 0 if row is None else 1)
+                if row:
+                    rows.append(row)
+
+            started = time.perf_counter()
+            con.commit()
+            handler._notify("commit", started)
+
+        stocks = {}
+        for row in rows:
+            stock = ProductStock._from_row(row)
+            stock._invalidate_cache()
+            stocks[stock.CODPROD] = stock
+        return stocks
@@ -0,0 +1,76 @@
+from __future__ import annotations
+import numpy as np
+
+from models.firebird.product import ProductStock
+
+
+class StockValuation:
+    """Stock valuation of a company
+
+    The stock and prices are fetched per column and computed with numpy,
+    without building an object per product.
+
+    Attributes:
+        CODEMPRESA:
+            The company of the stock.
+        CODPRECO:
+            The price table used on the valuation.
+    """
+
+    def __init__(self, CODEMPRESA: str, CODPRECO: str = "000000001") -> None:
+        columns = ProductStock.fetch_valuation(CODEMPRESA, CODPRECO)
+
+        self.codes = np.array(columns.get("CODPROD", []), dtype=object)
+        self.sectors = np.array(
+            [str(sector) for sector in columns.get("CODSETORESTOQUE", [])], dtype=object
+        )
+        self.stock = np.frombuffer(columns["ESTATU"], dtype=np.float64)
+        self.price = np.frombuffer(columns["PRECO"], dtype=np.float64)
+
+        self.value = self.stock * np.nan_to_num(self.price)
+
+    def json(self, low: float) -> dict:
+        sectors, sector_idx = np.unique(self.sectors, return_inverse=True)
+        sector_value = np.bincount(
+            sector_idx, weights=self.value, minlength=len(sectors)
+        )
+        sector_stock = np.bincount(
+            sector_idx, weights=self.stock, minlength=len(sectors)
+        )
+        sector_count = np.bincount(sector_idx, minlength=len(sectors))
+
+        negative = np.flatnonzero(self.stock < 0)
+        low_stock = np.flatnonzero((self.stock >= 0) & (self.stock <= low))
+
+        return {
+            "products": int(len(self.codes)),
+            "value": float(self.value.sum()),
+            "without_price": int(np.isnan(self.price).sum()),
+            "sectors": [
+                {
+                    "CODSETORESTOQUE": sector,
+                    "products": int(count),
+                    "ESTATU": float(stock),
+                    "value": float(value),
+                }
+                for sector, count, stock, value in zip(
+                    sectors, sector_count, sector_stock, sector_value
+                )
+            ],
+            "negative": self._stock_list(negative),
+            "low": self._stock_list(low_stock),
+        }
+
+    def _stock_list(self, indexes: np.ndarray) -> list:
+        indexes = indexes[np.argsort(self.stock[indexes], kind="stable")]
+
+        return [
+            {
+                "CODPROD": code,
+                "ESTATU": float(stock),
+                "PRECO": None if np.isnan(price) else float(price),
+            }
+            for code, stock, price in zip(
+                self.codes[indexes], self.stock[indexes], self.price[indexes]
+            )
+        ]
@@ -0,0 +1,100 @@
+from sql_alchemy import db
+from datetime import datetime
+from sqlalchemy import inspect, text
+from sqlalchemy.dialects.sqlite import insert
+
+
+class ProductChangeModel(db.Model):
+    """Log of the products changed by the server
+
+    The PRODUTO and PRODUTOPRECO tables don't have a LAST_CHANGE column,
+    so the last time the server changed each product is kept here.
+
+    The products are kept by database, the FDBHandler database of the company,
+    saved as an empty string for the FIREBIRDPATH database.
+    """
+
+    __table_args__ = (
+        db.Index(
+            "ix_product_change_model_database_changed_at", "database", "changed_at"
+        ),
+    )
+
+    database = db.Column(db.String(18), primary_key=True, default="")
+    product_code = db.Column(db.String(18), primary_key=True)
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+    @classmethod
+    def record(cls, database, product_codes, changed_at=None):
+        """Saves the products of the database as changed now"""
+
+        product_codes = set(product_codes)
+        if not product_codes:
+            return
+
+        changed_at = changed_at or datetime.now()
+
+        query = insert(cls).values(
+            [
+                {
+                    "database": database or "",
+                    "product_code": code,
+                    "changed_at": changed_at,
+                }
+                for code in product_codes
+            ]
+        )
+        db.session.execute(
+            query.on_conflict_do_update(
+                index_elements=[cls.database, cls.product_code],
+                set_={"changed_at": query.excluded.changed_at},
+            )
+        )
+        db.session.commit()
+
+    @classmethod
+    def changed_since(cls, database, since):
+        """Gets the codes of the products of the database changed after since"""
+
+        query = db.session.query(cls.product_code).filter(
+            cls.database == (database or ""), cls.changed_at > since
+        )
+        return [product_code for product_code, in query]
+
+    @classmethod
+    def last_changed_at(cls, database, product_code=None):
+        """Gets when the last product of the database, or the product of product_code,
+        was changed, or None
+        """
+
+        query = db.session.query(cls.changed_at).filter(
+            cls.database == (database or "")
+        )
+
+        if product_code is not None:
+            return query.filter(cls.product_code == product_code).scalar()
+        return query.with_entities(db.func.max(cls.changed_at)).scalar()
+
+    @classmethod
+    def create_columns(cls):
+        """Rebuilds the table created before the database column
+
+        The database is part of the primary key, so the table is created again,
+        with the products changed before it on the FIREBIRDPATH database.
+        """
+
+        table = cls.__tablename__
+        columns = inspect(db.engine).get_columns(table)
+        if "database" in {column["name"] for column in columns}:
+            return
+
+        with db.engine.begin() as con:
+            con.execute(text(f"ALTER TABLE {table} RENAME TO {table}_old"))
+            cls.__table__.create(con)
+            con.execute(
+                text(
+                    f'INSERT INTO {table} ("database", product_code, changed_at) '
+                    f"SELECT '', product_code, changed_at FROM {table}_old"
+                )
+            )
+            con.execute(text(f"DROP TABLE {table}_old"))
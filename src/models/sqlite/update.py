@@ -1,25 +1,37 @@
 from sql_alchemy import db
 from datetime import datetime
+from sqlalchemy import inspect, text
 
-from models.sqlite.user import UserModel
+from models.sqlite.user import UserModel, UserDirectory
 
 
 class UpdateModel(db.Model):
+    __table_args__ = (
+        db.Index(
+            "ix_update_model_CODEMPRESA_product_code_created_at",
+            "CODEMPRESA",
+            "product_code",
+            "created_at",
+        ),
+        db.Index("ix_update_model_CODEMPRESA", "CODEMPRESA"),
+    )
+
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    CODEMPRESA = db.Column(db.String(18), nullable=False)
     user_id = db.Column(db.Integer, nullable=False)
     product_code = db.Column(db.String(18), nullable=False)
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
     quantity = db.Column(db.Integer, nullable=False)
 
     @classmethod
-    def find_by_product_code(cls, product_code):
-        updates = cls.query.filter_by(product_code=product_code)
+    def find_by_product_code(cls, CODEMPRESA, product_code):
+        updates = cls.query.filter_by(CODEMPRESA=CODEMPRESA, product_code=product_code)
         return updates
 
     @classmethod
-    def get_last_for_code(cls, product_code):
+    def get_last_for_code(cls, CODEMPRESA, product_code):
         update = (
-            cls.query.filter_by(product_code=product_code)
+            cls.query.filter_by(CODEMPRESA=CODEMPRESA, product_code=product_code)
             .order_by(cls.created_at.desc())
             .first()
         )
@@ -28,12 +40,128 @@ class UpdateModel(db.Model):
         else:
             return None
 
-    def as_dict(self):
-        user = UserModel.find_user(self.user_id)
+    @classmethod
+    def get_last_for_codes(cls, CODEMPRESA, product_codes):
+        last_dates = (
+            db.session.query(
+                cls.product_code, db.func.max(cls.created_at).label("created_at")
+            )
+            .filter(
+                cls.CODEMPRESA == CODEMPRESA,
+                cls.product_code.in_(set(product_codes)),
+            )
+            .group_by(cls.product_code)
+            .subquery()
+        )
+        updates = cls.query.filter(cls.CODEMPRESA == CODEMPRESA).join(
+            last_dates,
+            db.and_(
+                cls.product_code == last_dates.c.product_code,
+                cls.created_at == last_dates.c.created_at,
+            ),
+        )
+        return {update.product_code: update for update in updates}
+
+    @classmethod
+    def last_created_at(cls, CODEMPRESA):
+        """Gets the created_at of the last update of the company, found by the primary key"""
+
+        last = (
+            db.session.query(cls.created_at)
+            .filter(cls.CODEMPRESA == CODEMPRESA)
+            .order_by(cls.id.desc())
+            .first()
+        )
+        return last[0] if last else None
+
+    @classmethod
+    def find_with_users(cls, CODEMPRESA, product_code):
+        """Finds all the updates of the product on the company, with their users on the same query"""
+
+        return cls._with_users_query(CODEMPRESA, product_code).order_by(cls.id).all()
+
+    @classmethod
+    def find_page_with_users(cls, CODEMPRESA, product_code, limit, after=None):
+        """Finds a page of the updates of the product on the company, the newest first
+
+        The pages are seeked by the created_at and id of the last update of the
+        previous page, using the (CODEMPRESA, product_code, created_at) index,
+        so the page depth don't matter.
+        The users are loaded on the same query.
+
+        Attributes:
+            CODEMPRESA:
+                The company of the updates.
+            product_code:
+                The CODPROD of the product.
+            limit:
+                The number of updates on the page.
+            after:
+                The (created_at, id) of the last update of the previous page.
+                This attribute is optional.
+
+        Returns:
+            A list of (UpdateModel, UserModel) tuples.
+        """
+
+        query = cls._with_users_query(CODEMPRESA, product_code)
+
+        if after:
+            created_at, id = after
+            query = query.filter(
+                db.or_(
+                    cls.created_at < created_at,
+                    db.and_(cls.created_at == created_at, cls.id < id),
+                )
+            )
+
+        return query.order_by(cls.created_at.desc(), cls.id.desc()).limit(limit).all()
+
+    @classmethod
+    def _with_users_query(cls, CODEMPRESA, product_code):
+        return (
+            db.session.query(cls, UserModel)
+            .outerjoin(UserModel, UserModel.id == cls.user_id)
+            .filter(cls.CODEMPRESA == CODEMPRESA, cls.product_code == product_code)
+        )
+
+    @classmethod
+    def create_columns(cls, CODEMPRESA):
+        """Adds the CODEMPRESA column missing on a table created before it
+
+        The updates saved before it are setted to the default company, CODEMPRESA,
+        and the index without the company is replaced on create_indexes.
+        """
+
+        columns = inspect(db.engine).get_columns(cls.__tablename__)
+        if "CODEMPRESA" in {column["name"] for column in columns}:
+            return
+
+        default = str(CODEMPRESA).replace("'", "''")
+        with db.engine.begin() as con:
+            con.execute(
+                text(
+                    f"ALTER TABLE {cls.__tablename__} ADD COLUMN "
+                    f"CODEMPRESA VARCHAR(18) NOT NULL DEFAULT '{default}'"
+                )
+            )
+            con.execute(
+                text("DROP INDEX IF EXISTS ix_update_model_product_code_created_at")
+            )
+
+    @classmethod
+    def create_indexes(cls):
+        """Creates the indexes missing on a table created before them"""
+
+        for index in cls.__table__.indexes:
+            index.create(db.engine, checkfirst=True)
+
+    def as_dict(self, user=None):
+        user = user.as_dict() if user else UserDirectory.get(self.user_id)
 
         return {
             "id": self.id,
-            "user": user.as_dict(),
+            "user": user,
             "product_code": self.product_code,
             "created_at": str(self.created_at),
             "quantity": self.quantity,
@@ -42,3 +170,8 @@ class UpdateModel(db.Model):
     def save_update(self):
         db.session.add(self)
         db.session.commit()
+
+    @staticmethod
+    def save_updates(updates):
+        db.session.add_all(updates)
+        db.session.commit()
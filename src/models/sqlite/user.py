@@ -1,5 +1,6 @@
 from sql_alchemy import db
 from datetime import datetime
+import threading
 
 
 class UserModel(db.Model):
@@ -33,3 +34,73 @@ class UserModel(db.Model):
     def save_user(self):
         db.session.add(self)
         db.session.commit()
+
+
+class UserDirectory:
+    """In memory directory of the users, by id and by phone_id
+
+    The users are few and rarely change, so all of them are loaded at once
+    and kept as dicts, without querying the database on every request.
+    Users not found are looked up on the database, as they may be created by other process.
+    The directory must be invalidated when a user is saved.
+    """
+
+    _by_id = None
+    _by_phone = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def warm(cls):
+        """Loads all the users from the database"""
+
+        users = [user.as_dict() for user in UserModel.query.all()]
+
+        with cls._lock:
+            cls._by_id = {user["id"]: user for user in users}
+            cls._by_phone = {user["phone_id"]: user for user in users}
+
+    @classmethod
+    def invalidate(cls):
+        """Clears the directory, that is loaded again on the next lookup"""
+
+        with cls._lock:
+            cls._by_id = None
+            cls._by_phone = None
+
+    @classmethod
+    def get(cls, id):
+        """Gets the user dict by id, or None when not found"""
+
+        try:
+            id = int(id)
+        except (TypeError, ValueError):
+            return None
+
+        return cls._lookup("_by_id", id, UserModel.find_user)
+
+    @classmethod
+    def get_by_phone(cls, phone_id):
+        """Gets the user dict by phone_id, or None when not found"""
+
+        return cls._lookup("_by_phone", phone_id, UserModel.find_by_phone)
+
+    @classmethod
+    def _lookup(cls, index, key, find):
+        users = getattr(cls, index)
+        if users is None:
+            cls.warm()
+            users = getattr(cls, index) or {}
+
+        user = users.get(key)
+        if user is None:
+            found = find(key)
+            if not found:
+                return None
+
+            user = found.as_dict()
+            with cls._lock:
+                if cls._by_id is not None:
+                    cls._by_id[user["id"]] = user
+                    cls._by_phone[user["phone_id"]] = user
+
+        return dict(user)
@@ -0,0 +1,51 @@
+import json
+import sys
+from flask import make_response
+from flask_restful.representations.json import output_json as restful_output_json
+
+sys.path.insert(0, "./")
+from src.ORM.FDB_handler import convert_value
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def default(value):
+    """Converts the values not supported by the encoder, like Decimal"""
+
+    converted = convert_value(value)
+    if converted is value:
+        raise TypeError(
+            f"Object of type {type(value).__name__} is not JSON serializable"
+        )
+    return converted
+
+
+def dumps(data) -> bytes:
+    """Encodes the data as JSON, with orjson when installed"""
+
+    if orjson is not None:
+        return orjson.dumps(
+            data,
+            default=default,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME,
+        )
+    return json.dumps(data, default=default).encode()
+
+
+def output_json(data, code: int, headers: dict = None):
+    """Makes the Flask-RESTful responses with orjson when installed
+
+    orjson writes the response bytes straight from the dicts,
+    many times faster than the json module.
+    Without it the default Flask-RESTful representation is used.
+    """
+
+    if orjson is None:
+        return restful_output_json(data, code, headers)
+
+    response = make_response(dumps(data) + b"\n", code)
+    response.headers.extend(headers or {})
+    return response
@@ -1,24 +1,39 @@
 import datetime
+import sys
 from flask_restful import Resource, reqparse
 from flask_jwt_extended import create_access_token
 
-from models.sqlite.user import UserModel
+from models.sqlite.user import UserDirectory
+
+sys.path.insert(0, "./")
+from src.ORM.FDB_handler import FDBHandler
 
 
 class Authentication(Resource):
     args = reqparse.RequestParser()
     args.add_argument("phone_id", type=str, required=True)
+    args.add_argument("CODEMPRESA", type=str)
 
     def post(self):
-        phone_id = Authentication.args.parse_args()["phone_id"]
+        args = Authentication.args.parse_args()
+        phone_id = args["phone_id"]
+        CODEMPRESA = args["CODEMPRESA"]
 
-        user = UserModel.find_by_phone(phone_id)
+        user = UserDirectory.get_by_phone(phone_id)
 
         if not user:
             return {"message": "Usuario não encontrado"}, 404
 
+        additional_claims = {}
+        if CODEMPRESA:
+            if CODEMPRESA not in FDBHandler().companies:
+                return {"message": "Empresa inválida"}, 400
+            additional_claims["CODEMPRESA"] = CODEMPRESA
+
         token = create_access_token(
-            identity=user.id, expires_delta=datetime.timedelta(hours=12)
+            identity=user["id"],
+            expires_delta=datetime.timedelta(hours=12),
+            additional_claims=additional_claims,
         )
 
         return {"token": token}, 200
@@ -0,0 +1,13 @@
+import sys
+from flask_restful import Resource
+
+sys.path.insert(0, "./")
+from src.ORM.FDB_handler import ModelMeta
+
+
+class Cache(Resource):
+    def get(self):
+        return {
+            model.__tablename__: model.cache_stats()
+            for model in ModelMeta.cached_models
+        }
@@ -1,37 +1,234 @@
-from flask import request
+from datetime import datetime, timedelta
+import sys
+from itertools import islice
+from flask import Response, g, request, send_file, stream_with_context
 from flask_restful import Resource
+from decouple import config
 
-from models.firebird.product import ProductModel
+from models.firebird.product import ProductModel, ProductStock
+from models.sqlite.product_change import ProductChangeModel
+from models.firebird.product_search import ProductSearchIndex
+from models.firebird.catalogue_snapshot import CatalogueSnapshot
+from representations import dumps
+from conditional import conditional
+
+sys.path.insert(0, "./")
+from src.ORM.FDB_handler import FDBHandler
+
+CONCURRENT_FETCH = config("CONCURRENT_FETCH", default=True, cast=bool)
+CHANGES_MARGIN = config("CHANGES_MARGIN", default=60, cast=float)
 
 
 class Products(Resource):
     def get(self):
         NOMEPROD = request.args.get("NOMEPROD")
         PAGE = request.args.get("PAGE")
+        CURSOR = request.args.get("CURSOR")
+        CODPRECO = request.args.get("CODPRECO", "000000001")
 
         try:
             PAGE = int(PAGE)
         except:
             PAGE = 1
 
+        try:
+            fields, columns = ProductModel.parse_fields(request.args.get("fields"))
+        except ValueError as e:
+            return {"message": f"Campo inválido: {e}"}, 400
+
+        keyset = CURSOR is not None
+        after = None
+
+        if CURSOR:
+            try:
+                after = ProductModel.decode_cursor(CURSOR)
+            except ValueError:
+                return {"message": "Cursor inválido"}, 400
+
+            # The search cursor is the offset on the ranked results, the listing one the CODPROD
+            if NOMEPROD:
+                valid = type(after) is int and after >= 0
+            else:
+                valid = isinstance(after, str)
+            if not valid:
+                return {"message": "Cursor inválido"}, 400
+
+        try:
+            version = ProductModel.catalogue_version(g.CODEMPRESA)
+            if NOMEPROD:
+                index = ProductSearchIndex.for_company()
+                index.ensure_fresh()
+                version += (index.version,)
+        except Exception as e:
+            return {"message": "Erro ao pesquisar o produto", "error": str(e)}, 500
+
+        not_modified, headers = conditional((request.full_path, version), version[0])
+        if not_modified:
+            return not_modified
+
         try:
             if NOMEPROD:
-                products = ProductModel.find_by_columns(
-                    NOMEPROD=NOMEPROD, exact=False, page=PAGE, limit=50
+                return (
+                    self.search(
+                        NOMEPROD, PAGE, keyset, after, fields, columns, CODPRECO
+                    ),
+                    200,
+                    headers,
                 )
             else:
-                products = ProductModel.all(page=PAGE, limit=50)
+                products = ProductModel.all(
+                    page=PAGE, limit=50, keyset=keyset, after=after, columns=columns
+                )
         except Exception as e:
             return {"message": "Erro ao pesquisar o produto", "error": str(e)}, 500
 
-        return [product.json() for product in products]
+        if keyset:
+            return (
+                {
+                    "products": ProductModel.json_many(
+                        products,
+                        concurrent=CONCURRENT_FETCH,
+                        fields=fields,
+                        CODPRECO=CODPRECO,
+                    ),
+                    "next": ProductModel.next_cursor(products, 50),
+                },
+                200,
+                headers,
+            )
+        return (
+            ProductModel.json_many(
+                products,
+                concurrent=CONCURRENT_FETCH,
+                fields=fields,
+                CODPRECO=CODPRECO,
+            ),
+            200,
+            headers,
+        )
+
+    @staticmethod
+    def search(
+        NOMEPROD: str,
+        PAGE: int,
+        keyset: bool,
+        after: int,
+        fields: list = None,
+        columns: tuple = None,
+        CODPRECO: str = "000000001",
+    ):
+        """Searchs the products on the ProductSearchIndex
+
+        With keyset the cursor holds the position on the ranked results.
+        Only the fields are returned, selecting only the columns,
+        with the PRECO of the CODPRECO price tier.
+        """
+
+        start = (after or 0) if keyset else 50 * (max(PAGE, 1) - 1)
+
+        codes = ProductSearchIndex.for_company().search(NOMEPROD)
+        page_codes = codes[start : start + 50]
+
+        products = {
+            product.CODPROD: product
+            for product in ProductModel.find_by_values(
+                "CODPROD", page_codes, columns=columns
+            )
+        }
+        products = [products[code] for code in page_codes if code in products]
+
+        if keyset:
+            next_cursor = None
+            if len(codes) > start + 50:
+                next_cursor = ProductModel.encode_cursor(start + 50)
+
+            return {
+                "products": ProductModel.json_many(
+                    products,
+                    concurrent=CONCURRENT_FETCH,
+                    fields=fields,
+                    CODPRECO=CODPRECO,
+                ),
+                "next": next_cursor,
+            }
+        return ProductModel.json_many(
+            products,
+            concurrent=CONCURRENT_FETCH,
+            fields=fields,
+            CODPRECO=CODPRECO,
+        )
 
 
 class ProductDetail(Resource):
     def get(self, id):
 
         try:
-            product = ProductModel.find_by_key(id)
+            fields, columns = ProductModel.parse_fields(request.args.get("fields"))
+        except ValueError as e:
+            return {"message": f"Campo inválido: {e}"}, 400
+
+        try:
+            product = ProductModel.find_by_key(id, columns)
+
+            if not product:
+                return {"message": "Produto não encontrado"}, 404
+
+        except Exception as e:
+            return {"message": "Erro ao pesquisar o produto", "error": str(e)}, 500
+
+        return self.respond(product, fields, request.args.get("CODPRECO", "000000001"))
+
+    @staticmethod
+    def respond(
+        product: ProductModel, fields: list = None, CODPRECO: str = "000000001"
+    ):
+        """Returns the product with its relations, or 304 when the client already have it
+
+        The version is checked with the cached stock and the last stock update,
+        when they are on fields, before loading the prices.
+        Without them it's checked with the product row and its last change alone.
+        """
+
+        try:
+            stock, _, last_stock_update = product.get_relations(
+                CONCURRENT_FETCH,
+                [
+                    relation
+                    for relation in ("ESTOQUE", "last_stock_update")
+                    if fields is None or relation in fields
+                ],
+            )
+            version = product.get_version(stock, last_stock_update)
+        except Exception as e:
+            return {"message": "Erro ao pesquisar o produto", "error": str(e)}, 500
+
+        not_modified, headers = conditional((fields, CODPRECO, version), version[0])
+        if not_modified:
+            return not_modified
+
+        prices = None
+        if fields is None or {"PRECO", "PRECOS"} & set(fields):
+            try:
+                prices = product.get_prices()
+            except Exception as e:
+                return {"message": "Erro ao pesquisar o produto", "error": str(e)}, 500
+
+        return (
+            product._build_json(stock, prices, last_stock_update, fields, CODPRECO),
+            200,
+            headers,
+        )
+
+
+class ProductByCode(Resource):
+    def get(self, codigo):
+        try:
+            fields, _ = ProductModel.parse_fields(request.args.get("fields"))
+        except ValueError as e:
+            return {"message": f"Campo inválido: {e}"}, 400
+
+        try:
+            product = self.find(codigo)
 
             if not product:
                 return {"message": "Produto não encontrado"}, 404
@@ -39,4 +236,113 @@ class ProductDetail(Resource):
         except Exception as e:
             return {"message": "Erro ao pesquisar o produto", "error": str(e)}, 500
 
-        return product.json()
+        return ProductDetail.respond(
+            product, fields, request.args.get("CODPRECO", "000000001")
+        )
+
+    @staticmethod
+    def find(codigo: str) -> ProductModel:
+        """Finds the product by the code, like the barcode
+
+        The code is found on the CODIGO hash map of the company ProductSearchIndex,
+        and the product by its cached key, so the scans don't query the PRODUTO table.
+        When the code isn't indexed, or the index is outdated,
+        it's searched on the database and the index is corrected.
+        """
+
+        index = ProductSearchIndex.for_company()
+        normalized = index.normalize_code(codigo)
+
+        for codprod in index.find_by_code(codigo):
+            product = ProductModel.find_by_key(codprod)
+
+            if product is None:
+                index.remove(codprod)
+            elif index.normalize_code(product.CODIGO) == normalized:
+                return product
+            else:
+                index.put(product.CODPROD, product.CODIGO, product.NOMEPROD)
+
+        products = ProductModel.find_by_columns(CODIGO=codigo) or []
+        for product in products:
+            index.put(product.CODPROD, product.CODIGO, product.NOMEPROD)
+
+        return min(products, key=lambda product: product.CODPROD, default=None)
+
+
+class ProductExport(Resource):
+    def get(self):
+        CODPRECO = request.args.get("CODPRECO", "000000001")
+
+        def generate():
+            products = ProductModel.iter_objects()
+
+            while True:
+                batch = list(islice(products, 500))
+                if not batch:
+                    break
+
+                for product in ProductModel.json_many(
+                    batch, concurrent=CONCURRENT_FETCH, CODPRECO=CODPRECO
+                ):
+                    yield dumps(product) + b"\n"
+
+        return Response(
+            stream_with_context(generate()), mimetype="application/x-ndjson"
+        )
+
+
+class ProductChanges(Resource):
+    def get(self):
+        since = request.args.get("since")
+        CODPRECO = request.args.get("CODPRECO", "000000001")
+
+        try:
+            since = datetime.fromisoformat(since)
+        except (TypeError, ValueError):
+            return {"message": "Informe a data da última sincronização"}, 400
+
+        # The LAST_CHANGE is setted before the commit, so the changes commited after the querys
+        # can be older than the querys. They are sent again on the next sync, inside the margin.
+        watermark = datetime.now() - timedelta(seconds=CHANGES_MARGIN)
+
+        try:
+            codes = set(ProductStock.changed_since(g.CODEMPRESA, since))
+            codes.update(ProductChangeModel.changed_since(FDBHandler().database, since))
+
+            products = ProductModel.find_by_values("CODPROD", list(codes))
+        except Exception as e:
+            return {"message": "Erro ao pesquisar o produto", "error": str(e)}, 500
+
+        return {
+            "products": ProductModel.json_many(
+                products, concurrent=CONCURRENT_FETCH, CODPRECO=CODPRECO
+            ),
+            "deleted": sorted(codes - {product.CODPROD for product in products}),
+            "watermark": watermark.isoformat(),
+        }
+
+
+class ProductSnapshot(Resource):
+    def get(self):
+        path, etag, built_at = CatalogueSnapshot.for_company(g.CODEMPRESA).current()
+
+        if not path:
+            return (
+                {"message": "O catálogo ainda está sendo gerado"},
+                503,
+                {"Retry-After": "30"},
+            )
+
+        response = send_file(
+            path,
+            mimetype="application/gzip",
+            as_attachment=True,
+            download_name="catalogue.ndjson.gz",
+            etag=etag,
+            last_modified=built_at,
+            max_age=0,
+            conditional=True,
+        )
+        response.headers["X-Snapshot-Version"] = built_at.isoformat()
+        return response
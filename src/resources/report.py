@@ -0,0 +1,21 @@
+from flask import g, request
+from flask_restful import Resource
+
+from models.firebird.stock_valuation import StockValuation
+
+
+class StockReport(Resource):
+    def get(self):
+        CODPRECO = request.args.get("CODPRECO", "000000001")
+
+        try:
+            LOW = float(request.args.get("LOW", 5))
+        except ValueError:
+            return {"message": "LOW inválido"}, 400
+
+        try:
+            report = StockValuation(g.CODEMPRESA, CODPRECO)
+        except Exception as e:
+            return {"message": "Erro ao gerar o relatório", "error": str(e)}, 500
+
+        return report.json(LOW)
@@ -1,11 +1,13 @@
-from flask import request
+from flask import g, request
 from flask_restful import Resource, reqparse
 from flask_jwt_extended import jwt_required, get_jwt
-from decouple import config
 
 from models.firebird.product import ProductStock
 from models.sqlite.update import UpdateModel
+from models.sqlite.user import UserDirectory
 from models.firebird.product import ProductModel
+from models.firebird.stock_adjustment import StockAdjustmentQueue
+from conditional import conditional
 
 
 class Stock(Resource):
@@ -20,7 +22,7 @@ class Stock(Resource):
 
         try:
             stock = ProductStock.find_by_columns(
-                CODPROD=CODPROD, CODEMPRESA=config("CODEMPRESA")
+                CODPROD=CODPROD, CODEMPRESA=g.CODEMPRESA
             )
             if not stock:
                 return {"message": "Nenhum produto encontrado"}, 404
@@ -28,7 +30,11 @@ class Stock(Resource):
         except Exception as e:
             return {"message": "Erro ao pesquisar o produto", "error": str(e)}, 500
 
-        return stock[0].json()
+        not_modified, headers = conditional((repr(stock[0]),), stock[0].LAST_CHANGE)
+        if not_modified:
+            return not_modified
+
+        return stock[0].json(), 200, headers
 
     @jwt_required()
     def patch(self):
@@ -43,22 +49,25 @@ class Stock(Resource):
         if not CODPROD:
             return 400
 
+        if not UserDirectory.get(user_id):
+            return {"message": "Usuario não encontrado"}, 404
+
         try:
-            stock = ProductStock.find_by_columns(
-                CODPROD=CODPROD, CODEMPRESA=config("CODEMPRESA")
-            )[0]
+            stock = StockAdjustmentQueue().adjust(CODPROD, g.CODEMPRESA, amount)
             if not stock:
                 return {"message": "Nenhum produto encontrado"}, 404
 
-            stock.ESTATU = float(stock.ESTATU) + amount
-            stock.update()
-
-            update = UpdateModel(user_id=user_id, product_code=CODPROD, quantity=amount)
+            update = UpdateModel(
+                CODEMPRESA=g.CODEMPRESA,
+                user_id=user_id,
+                product_code=CODPROD,
+                quantity=amount,
+            )
             update.save_update()
 
             product = ProductModel.find_by_key(CODPROD)
 
-            if product:
+            if product and not product.FLAGCONTROLAESTOQUE:
                 product.FLAGCONTROLAESTOQUE = True
                 product.update()
                 product.commit()
@@ -67,3 +76,96 @@ class Stock(Resource):
             return {"message": "Erro ao salvar o produto", "error": str(e)}, 500
 
         return stock.json()
+
+
+class StockBulk(Resource):
+    @jwt_required()
+    def patch(self):
+        items = request.get_json(silent=True)
+        user_id = get_jwt()["sub"]
+
+        if not isinstance(items, list):
+            return {"message": "Envie uma lista de ajustes"}, 400
+
+        if not UserDirectory.get(user_id):
+            return {"message": "Usuario não encontrado"}, 404
+
+        results = []
+        adjustments = []
+
+        for item in items:
+            CODPROD = item.get("CODPROD") if isinstance(item, dict) else None
+            amount = item.get("amount") if isinstance(item, dict) else None
+
+            if (
+                not CODPROD
+                or not isinstance(amount, (int, float))
+                or isinstance(amount, bool)
+                or not amount
+            ):
+                results.append(
+                    {"CODPROD": CODPROD, "status": 400, "message": "Ajuste inválido"}
+                )
+            else:
+                results.append({"CODPROD": CODPROD, "status": 200})
+                adjustments.append((results[-1], CODPROD, amount))
+
+        amounts = {}
+        for _, CODPROD, amount in adjustments:
+            amounts[CODPROD] = amounts.get(CODPROD, 0) + amount
+
+        futures = StockAdjustmentQueue().adjust_many(g.CODEMPRESA, amounts)
+
+        # The stocks are commited by the queue, so from here on the errors
+        # are reported on the items, and a retry don't adjust them again
+        saved = []
+        updates = []
+        for result, CODPROD, amount in adjustments:
+            error = futures[CODPROD].exception()
+
+            if error is not None:
+                result["status"] = 500
+                result["message"] = "Erro ao salvar o produto"
+                result["error"] = str(error)
+            elif futures[CODPROD].result() is None:
+                result["status"] = 404
+                result["message"] = "Nenhum produto encontrado"
+            else:
+                result["stock"] = futures[CODPROD].result().json()
+                saved.append(result)
+                updates.append(
+                    UpdateModel(
+                        CODEMPRESA=g.CODEMPRESA,
+                        user_id=user_id,
+                        product_code=CODPROD,
+                        quantity=amount,
+                    )
+                )
+
+        try:
+            UpdateModel.save_updates(updates)
+        except Exception as e:
+            for result in saved:
+                result["message"] = "Estoque salvo, mas o histórico não foi salvo"
+                result["error"] = str(e)
+
+        try:
+            products = [
+                product
+                for product in ProductModel.find_by_values(
+                    "CODPROD", list({result["CODPROD"] for result in saved})
+                )
+                if not product.FLAGCONTROLAESTOQUE
+            ]
+            for product in products:
+                product.FLAGCONTROLAESTOQUE = True
+            ProductModel.update_many(products)
+            ProductModel.commit()
+        except Exception as e:
+            for result in saved:
+                result.setdefault(
+                    "message", "Estoque salvo, mas o produto não foi atualizado"
+                )
+                result.setdefault("error", str(e))
+
+        return results
@@ -1,18 +1,53 @@
-from flask import request
+import sys
+from datetime import datetime
+from flask import g, request
 from flask_restful import Resource, reqparse
 
 from models.sqlite.update import UpdateModel
 
+sys.path.insert(0, "./")
+from src.ORM.FDB_handler import FDBModel
+
 
 class Update(Resource):
     def get(self, id):
         if not id:
             return 400
 
+        LIMIT = request.args.get("LIMIT")
+        CURSOR = request.args.get("CURSOR")
+
+        if LIMIT is None and CURSOR is None:
+            try:
+                updates = UpdateModel.find_with_users(g.CODEMPRESA, product_code=id)
+                updates_json = [update.as_dict(user) for update, user in updates]
+            except Exception as e:
+                return {"message": "Erro ao pesquisar o produto", "error": str(e)}, 500
+
+            return updates_json
+
         try:
-            updates = UpdateModel.find_by_product_code(product_code=id)
-            updates_json = [update.as_dict() for update in updates]
+            LIMIT = min(max(int(LIMIT), 1), 500)
+        except (TypeError, ValueError):
+            LIMIT = 50
+
+        after = None
+        if CURSOR:
+            try:
+                created_at, update_id = FDBModel.decode_cursor(CURSOR)
+                after = datetime.fromisoformat(created_at), int(update_id)
+            except (TypeError, ValueError):
+                return {"message": "Cursor inválido"}, 400
+
+        try:
+            updates = UpdateModel.find_page_with_users(g.CODEMPRESA, id, LIMIT, after)
+            updates_json = [update.as_dict(user) for update, user in updates]
         except Exception as e:
             return {"message": "Erro ao pesquisar o produto", "error": str(e)}, 500
 
-        return updates_json
+        next_cursor = None
+        if len(updates) == LIMIT:
+            last = updates[-1][0]
+            next_cursor = FDBModel.encode_cursor([last.created_at.isoformat(), last.id])
+
+        return {"updates": updates_json, "next": next_cursor}
@@ -2,7 +2,7 @@ from flask import request, jsonify
 from flask_restful import Resource, reqparse
 from sql_alchemy import db
 
-from models.sqlite.user import UserModel
+from models.sqlite.user import UserModel, UserDirectory
 
 
 class User(Resource):
@@ -11,20 +11,21 @@ class User(Resource):
     args.add_argument("name", type=str, required=True)
 
     def get(self, id):
-        user = UserModel.find_user(id)
+        user = UserDirectory.get(id)
 
         if not user:
             return {"message": "Usuario não encontrado"}, 404
 
-        return jsonify(user.as_dict())
+        return jsonify(user)
 
     def put(self, id=None):
         args = User.args.parse_args()
 
-        if UserModel.find_by_phone(args["phone_id"]):
+        if UserDirectory.get_by_phone(args["phone_id"]):
             return {"message": "Usuario já existente"}, 400
 
         user = UserModel(**args)
         user.save_user()
+        UserDirectory.invalidate()
 
         return jsonify(user.as_dict())